@@ -1,32 +1,51 @@
 # This script converts each copyright registration record from XML to
 # JSON, with a minimum of processing.
-import json
+import argparse
 import os
 import uuid
+from multiprocessing import Pool
 
 from lxml import etree
 from tqdm import tqdm
 
+import codec
+import metrics
 from model import Registration
 
 
 class Parser:
-    def __init__(self):
+    # Tags that iterparse_file needs to see. Everything else is only
+    # looked at as a descendant of one of these.
+    STREAM_TAGS = ("year", "copyrightEntry", "crossRef", "entryGroup")
+
+    def __init__(self, streaming=True):
         self.parser = etree.XMLParser(recover=True)
         self.seen_tags = set()
         self.seen_publisher_tags = set()
+        self.streaming = streaming
 
     def process_directory_tree(self, path, xpath_="//copyrightEntry"):
         pbar = tqdm(unit_scale=True, unit=xpath_[2:], desc=f"Processing {xpath_}")
+        for path_ in self.volumes(path):
+            if self.streaming and xpath_ == "//copyrightEntry":
+                entries = self.iterparse_file(path_)
+            else:
+                entries = self.process_file(path_, xpath_=xpath_)
+            for entry in entries:
+                yield entry
+                pbar.update(1)
+
+    def volumes(self, path):
+        """Yield the path to every XML volume under `path`, in the order
+        they're processed.
+        """
         for dir_, subdirs, files in os.walk(path):
             if "alto" in subdirs:
                 subdirs.remove("alto")
             for i in files:
                 if not i.endswith("xml"):
                     continue
-                for entry in self.process_file(os.path.join(dir_, i), xpath_=xpath_):
-                    yield entry
-                    pbar.update(1)
+                yield os.path.join(dir_, i)
 
 
     # def process_file(self, path):
@@ -65,20 +84,146 @@ class Parser:
                 res["crossRef"] = "True"
                 yield res
 
+    def iterparse_file(self, path):
+        """Parse a volume in a single streaming pass.
+
+        This yields the same registrations as process_file(), but
+        instead of building the whole tree and then querying it twice,
+        it handles each <copyrightEntry> and <crossRef> as soon as the
+        parser finishes it, then throws it away. Memory use depends on
+        the size of the biggest entry, not the size of the volume.
+
+        Registrations and cross-references are interleaved in document
+        order rather than coming out in two separate runs, but each
+        kind keeps its own order, so the output files are the same.
+        """
+        year = None
+        # Units finished before we saw the <year> tag. This doesn't
+        # happen in practice but it's cheap to handle.
+        pending = []
+        entry_depth = group_depth = 0
+        for event, elem in etree.iterparse(
+            path, events=("start", "end"), tag=self.STREAM_TAGS, recover=True
+        ):
+            tag = elem.tag
+            if event == "start":
+                if tag == "copyrightEntry":
+                    entry_depth += 1
+                elif tag == "entryGroup":
+                    group_depth += 1
+                continue
+
+            if tag == "year":
+                if year is None:
+                    year = elem.text
+                    for unit in pending:
+                        yield from self._process_unit(unit, year)
+                    pending = []
+                continue
+            if tag == "copyrightEntry":
+                entry_depth -= 1
+            elif tag == "entryGroup":
+                group_depth -= 1
+
+            # An <entryGroup> is handled as a unit once it's complete,
+            # because a <crossRef> inside it looks at the group's
+            # <author> tag. Entries nested inside other entries are
+            # handled along with the outermost entry.
+            if entry_depth or group_depth:
+                continue
+
+            if year is None:
+                pending.append(elem)
+                continue
+            yield from self._process_unit(elem, year)
+
+            # Everything before this point in the document has been
+            # dealt with.
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+        for unit in pending:
+            yield from self._process_unit(unit, year)
+
+    def _process_unit(self, elem, year):
+        """Turn a complete top-level <copyrightEntry>, <crossRef> or
+        <entryGroup> into JSON, then clear it out of the tree.
+        """
+        for e in elem.iter("copyrightEntry"):
+            for registration in Registration.from_tag(e, include_extra=True):
+                registration.year = year
+                yield registration.jsonable()
+        for e in elem.iter("crossRef"):
+            for registration in Registration.from_crossref_tag(e):
+                registration.year = year
+                res = registration.jsonable()
+                res["crossRef"] = "True"
+                yield res
+        elem.clear(keep_tail=True)
+
+
+def parse_volume(path):
+    """Parse a single volume into encoded records.
+
+    This is the unit of work handed to each worker process, so it
+    does the encoding as well as the parsing -- otherwise the main
+    process would spend all its time encoding.
+
+    :return: A 2-tuple (registration records, crossRef records).
+    """
+    encode = codec.encoder(codec.FORMAT, sort_keys=True)
+    registrations = []
+    cross_references = []
+    for parsed in Parser().iterparse_file(path):
+        if parsed.get("crossRef"):
+            destination = cross_references
+        else:
+            destination = registrations
+        destination.append(encode(parsed))
+    return registrations, cross_references
+
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to parse volumes with.",
+    )
+    args = arg_parser.parse_args()
+
     if not os.path.exists("output"):
         os.mkdir("output")
-    with open("output/0-parsed-registrations.ndjson", "w") as output, open(
-        "output/0-parsed-registrations-crossRef.ndjson", "w"
+    run = metrics.Metrics()
+    serialize = run.phase("serialize")
+    volumes = list(Parser().volumes("registrations/xml"))
+    pbar = tqdm(unit_scale=True, unit="copyrightEntry", desc="Processing volumes")
+    with codec.Writer(
+        codec.path("output/0-parsed-registrations"), sort_keys=True
+    ) as output, codec.Writer(
+        codec.path("output/0-parsed-registrations-crossRef"), sort_keys=True
     ) as cross:
-        for parsed in Parser().process_directory_tree("registrations/xml"):
-            if parsed.get("crossRef"):
-                json.dump(parsed, cross, sort_keys=True)
-                cross.write("\n")
-            else:
-                json.dump(parsed, output, sort_keys=True)
-                output.write("\n")
+        if args.workers > 1:
+            pool = Pool(args.workers)
+            # imap hands back results in volume order, so the output
+            # is the same no matter how many workers there are.
+            results = pool.imap(parse_volume, volumes)
+        else:
+            pool = None
+            results = map(parse_volume, volumes)
+        # Parsing includes encoding, which happens in parse_volume.
+        for registrations, cross_references in run.timed("parse", results):
+            with serialize:
+                output.write_encoded(registrations)
+                cross.write_encoded(cross_references)
+            pbar.update(len(registrations) + len(cross_references))
+            run.count(len(registrations) + len(cross_references))
+        if pool:
+            pool.close()
+            pool.join()
+    run.finish()
     # with open("output/0-parsed-registrations-cross-ref.ndjson", "w") as output:
     #     for parsed in Parser().process_directory_tree("registrations/xml", xpath_="//crossRef"):
     #         json.dump(parsed, output, sort_keys=True)
@@ -1,15 +1,19 @@
 # This script converts each copyright renewal record from CSV to
 # a JSON format similar to (but much simpler than) that created by
 # 0-parse-registrations.py.
-import json
 import os
 from collections import defaultdict
 from csv import DictReader
+from functools import lru_cache
 
 from tqdm import tqdm
 
+import codec
+import metrics
 from model import Renewal
 
+LLM_RENEWALS = "llm/renewals-from-lm.ndjson"
+
 
 class Parser(object):
 
@@ -18,14 +22,22 @@ class Parser(object):
         self.cross_references = defaultdict(list)
 
     def process_directory_tree(self, path):
+        for i in self.renewal_files(path):
+            for entry in self.process_file(i):
+                yield entry
+                self.pbar.update(1)
+
+    @classmethod
+    def renewal_files(cls, path):
+        """Yield the path to every renewal TSV under `path`, in the order
+        they're processed.
+        """
         for i in os.listdir(path):
             if not i.endswith('tsv'):
                 continue
             if i == 'TOC.tsv':
                 continue
-            for entry in self.process_file(os.path.join(path, i)):
-                yield entry
-                self.pbar.update(1)
+            yield os.path.join(path, i)
 
     def process_file(self, path):
         with open(path, 'rt') as f:
@@ -33,48 +45,82 @@ class Parser(object):
                 yield Renewal.from_dict(line)
 
 
-if __name__ == '__main__':
+@lru_cache(maxsize=None)
+def load_cross_references(path=LLM_RENEWALS):
+    """Load the renewal data extracted by the language model, keyed by
+    renewal UUID.
+    """
     cross_ref = defaultdict(list)
-    with open("llm/renewals-from-lm.ndjson") as f:
-        for line in f:
-            res = json.loads(line)
-            if uuid:= res.get("uuid"):
-                cross_ref[uuid].append(res)
-    with open("output/1-parsed-renewals.ndjson", "w") as output:
+    for res in codec.read(path):
+        if uuid:= res.get("uuid"):
+            cross_ref[uuid].append(res)
+    return cross_ref
+
+
+def apply_cross_reference(parsed, c):
+    """Fill in or correct a parsed Renewal with the data the language
+    model extracted for it.
+    """
+    c_auth: list = c.get("author")
+    c_regnum: list = c.get("regnum")
+    c_renewal_id: list = c.get("renewal_id", [])
+    c_title: str = c.get("title")
+    c_claim: list = c.get("claimants")
+
+    if not parsed.renewal_id:
+        if c_renewal_id:
+            parsed.renewal_id = c_renewal_id
+    if c_auth:
+        c_auth = filter(None, c_auth)
+        if c_auth:
+            parsed.author = " & ".join(c_auth)
+    if c_regnum:
+        parsed.regnum.extend(c_regnum)
+        parsed.regnum = list(set(parsed.regnum))
+        if parsed.renewal_id:
+            parsed.regnum = [x for x in parsed.regnum if x != parsed.renewal_id]
+    if c_title:
+        parsed.title = c_title
+    if c_claim and None not in c_claim:
+        if parsed.claimants:
+            try:
+                parsed.claimants += " |".join(c_claim)
+            except:
+                pass
+        else:
+            parsed.claimants = c_claim
+
+
+def parse_renewal_file(path):
+    """Parse a single renewal TSV into encoded records."""
+    encode = codec.encoder(codec.FORMAT)
+    cross_ref = load_cross_references()
+    records = []
+    with open(path, 'rt') as f:
+        for line in DictReader(f, dialect='excel-tab'):
+            parsed = Renewal.from_dict(line)
+            if parsed.uuid in cross_ref:
+                apply_cross_reference(parsed, cross_ref[parsed.uuid][0])
+            records.append(encode(parsed.jsonable()))
+    return records
+
+
+if __name__ == '__main__':
+    run = metrics.Metrics()
+    parse = run.phase("parse")
+    serialize = run.phase("serialize")
+    with parse:
+        cross_ref = load_cross_references()
+    with codec.Writer(codec.path("output/1-parsed-renewals")) as output:
         parser = Parser()
-        for parsed in parser.process_directory_tree("renewals/data"):
+        for parsed in run.timed("parse", parser.process_directory_tree("renewals/data")):
             # if parsed.regnum:
             #     if "A52449" in parsed.regnum:
             #         print("hello")
-            if parsed.uuid in cross_ref:
-                c = cross_ref[parsed.uuid][0]
-                c_auth: list = c.get("author")
-                c_regnum: list = c.get("regnum")
-                c_renewal_id: list = c.get("renewal_id", [])
-                c_title: str = c.get("title")
-                c_claim: list = c.get("claimants")
-
-                if not parsed.renewal_id:
-                    if c_renewal_id:
-                        parsed.renewal_id = c_renewal_id
-                if c_auth:
-                    c_auth = filter(None, c_auth)
-                    if c_auth:
-                        parsed.author = " & ".join(c_auth)
-                if c_regnum:
-                    parsed.regnum.extend(c_regnum)
-                    parsed.regnum = list(set(parsed.regnum))
-                    if parsed.renewal_id:
-                        parsed.regnum = [x for x in parsed.regnum if x != parsed.renewal_id]
-                if c_title:
-                    parsed.title = c_title
-                if c_claim and None not in c_claim:
-                    if parsed.claimants:
-                        try:
-                            parsed.claimants += " |".join(c_claim)
-                        except:
-                            pass
-                    else:
-                        parsed.claimants = c_claim
-            json.dump(parsed.jsonable(), output)
-            output.write("\n")
+            with parse:
+                if parsed.uuid in cross_ref:
+                    apply_cross_reference(parsed, cross_ref[parsed.uuid][0])
+            with serialize:
+                output.write(parsed.jsonable())
+            run.count()
+    run.finish()
@@ -9,10 +9,20 @@
 # Also eliminate from consideration renewals that do not correspond to
 # any registration in the dataset. (They're probably renewals for
 # some other piece of the dataset.)
-import json
+#
+# With --workers, the registrations are split into chunks and matched
+# in separate processes, each with its own connection to the renewal
+# index. The output is the same as a run with one process.
+import argparse
+import os
+from collections import Counter
+from multiprocessing import Pool
 
 from tqdm import tqdm
 
+import codec
+import dates
+import metrics
 from compare import Comparator
 from model import Registration, Renewal
 
@@ -23,23 +33,29 @@ class Processor:
         self.comparator = comparator
         self.output = output
         self.cross_references = cross_references
+        self.match = metrics.phase("match")
+        self.classify = metrics.phase("classify")
+        self.serialize = metrics.phase("serialize")
 
     def process(self, registration: "Registration"):
         # u = registration.uuid
         # if u == "163B6F95-72C4-1014-B53A-E905A29103D3":
         #     print("hello")
-        renewals: "Renewal" = self.comparator.renewal_for(registration)
+        with self.match:
+            renewals: "Renewal" = self.comparator.renewal_for(registration)
         registration.renewals = renewals
-        json.dump(registration.jsonable(require_disposition=True), self.output)
-        self.output.write("\n")
-        if registration.is_foreign:
+        with self.serialize:
+            self.output.write(registration.jsonable(require_disposition=True))
+        with self.classify:
+            foreign = registration.is_foreign
+        if foreign:
             # This looks like a foreign registration. We'll filter it out
             # in the next step, but we need to record its cross-references
             # now, so we can filter _those_ out in the next step.
-            for xref in registration.parse_xrefs():
-                out = self.cross_references
-                json.dump(xref.jsonable(), out)
-                out.write("\n")
+            with self.serialize:
+                for xref in registration.parse_xrefs():
+                    self.cross_references.write(xref.jsonable())
+        metrics.count()
 
         # Handle children as totally independent registrations. Note
         # that in the next step we may disquality children because the
@@ -51,26 +67,149 @@ class Processor:
             self.process(child)
 
 
+class Batch:
+    """Collect encoded records in a worker process, to be written out
+    by the main process.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.encode = codec.encoder(codec.FORMAT)
+
+    def write(self, record):
+        self.records.append(self.encode(record))
+
+
+def chunks(records, size):
+    """Split the registration records into lists of about `size`.
+
+    Comparator.renewal_for remembers the renewals it found by regnum
+    for the last registration that had a regnum, and a registration
+    with no regnums uses that leftover list. To give every chunk the
+    same result it would get in a serial run, a chunk only ever starts
+    with a registration that has a regnum of its own.
+    """
+    chunk = []
+    for data in records:
+        if len(chunk) >= size and any(data.get("regnums") or []):
+            yield chunk
+            chunk = []
+        chunk.append(data)
+    if chunk:
+        yield chunk
+
+
+# The Comparator used by each worker process.
+worker_comparator = None
+
+
+def start_worker(renewals_path):
+    global worker_comparator
+    worker_comparator = Comparator(renewals_path)
+
+
+def process_chunk(records):
+    """Match one chunk of registrations.
+
+    :return: A 4-tuple (encoded registrations, encoded cross-references,
+        index ids of the renewals that were matched, (process ID, this
+        worker's stats so far)).
+    """
+    annotated = Batch()
+    cross_references = Batch()
+    processor = Processor(worker_comparator, annotated, cross_references)
+    for data in records:
+        processor.process(Registration.from_json(data))
+    index = worker_comparator.index
+    used = [index.renewal_id(x) for x in worker_comparator.used_renewals]
+    worker_comparator.used_renewals.clear()
+    stats = dict(
+        dates=dates.stats(), renewal_counts=worker_comparator.renewal_counts
+    )
+    return annotated.records, cross_references.records, used, (os.getpid(), stats)
+
+
 if __name__ == "__main__":
-    with open("output/2-registrations-with-renewals.ndjson", "w") as annotated, open(
-            "output/2-cross-references-in-foreign-registrations.ndjson", "w") as cross_references:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to match registrations with.",
+    )
+    arg_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1000,
+        help="Number of registrations to hand to a worker at a time.",
+    )
+    args = arg_parser.parse_args()
+
+    run = metrics.Metrics()
+    serialize = run.phase("serialize")
+    renewals_path = codec.path("output/1-parsed-renewals")
+    registrations_path = codec.path("output/0-parsed-registrations")
+    with codec.Writer(codec.path("output/2-registrations-with-renewals")) as annotated, codec.Writer(
+            codec.path("output/2-cross-references-in-foreign-registrations")) as cross_references:
         pbar = tqdm(unit_scale=True, desc='Comparing Reg. with Ren.')
-        comparator = Comparator("output/1-parsed-renewals.ndjson")
-        processor = Processor(comparator, annotated, cross_references)
-        for i in open("output/0-parsed-registrations.ndjson"):
-            processor.process(Registration(**json.loads(i)))
-            pbar.update(1)
+        # This builds the renewal index if necessary, before any
+        # workers try to open it.
+        with run.phase("index"):
+            comparator = Comparator(renewals_path)
+        run.caches["dates"] = dates.stats
+        run.extra["renewals_per_registration"] = lambda: dict(
+            sorted(comparator.renewal_counts.items())
+        )
+        if args.workers > 1:
+            pool = Pool(args.workers, start_worker, (renewals_path,))
+            # imap hands back results in order, so the output is the
+            # same no matter how many workers there are.
+            results = pool.imap(
+                process_chunk,
+                chunks(codec.read(registrations_path), args.chunk_size),
+            )
+            # The stats from each worker add up as it goes; keep the
+            # latest.
+            worker_stats = {}
+            for registrations, xrefs, used, (pid, stats) in run.timed(
+                "match", results
+            ):
+                with serialize:
+                    annotated.write_encoded(registrations)
+                    cross_references.write_encoded(xrefs)
+                comparator.used_renewals.update(
+                    comparator.index.renewal(x) for x in used
+                )
+                worker_stats[pid] = stats
+                pbar.update(len(registrations))
+                run.count(len(registrations))
+            pool.close()
+            pool.join()
+            run.caches["dates"] = dates.combine(
+                x["dates"] for x in worker_stats.values()
+            )
+            comparator.renewal_counts = sum(
+                (x["renewal_counts"] for x in worker_stats.values()), Counter()
+            )
+        else:
+            processor = Processor(comparator, annotated, cross_references)
+            for registration in run.timed(
+                "parse", Registration.load(registrations_path)
+            ):
+                processor.process(registration)
+                pbar.update(1)
 
     # Now that we're done, we can divide up the renewals by whether
     # we found a registration for them.
 
-    with open("output/2-renewals-with-registrations.ndjson", "w") as renewals_matched, open(
-            "output/2-renewals-with-no-registrations.ndjson", "w") as renewals_not_matched:
-        for regnum, renewals in comparator.renewals.items():
+    with codec.Writer(codec.path("output/2-renewals-with-registrations")) as renewals_matched, codec.Writer(
+            codec.path("output/2-renewals-with-no-registrations")) as renewals_not_matched:
+        for regnum, renewals in run.timed("parse", comparator.index.items()):
             for renewal in renewals:
                 if renewal in comparator.used_renewals:
                     out = renewals_matched
                 else:
                     out = renewals_not_matched
-                json.dump(renewal.jsonable(), out)
-                out.write("\n")
+                with serialize:
+                    out.write(renewal.jsonable())
+    run.finish()
@@ -6,14 +6,18 @@
 #   published abroad -- we'll have to check on the next pass.
 
 import datetime
-import json
 from collections import defaultdict
 
 from tqdm import tqdm
 
+import codec
+import dates
+import metrics
 from model import Registration
 
-potentially_foreign = open("output/3-potentially-foreign-registrations.ndjson", "w")
+potentially_foreign = codec.Writer(
+    codec.path("output/3-potentially-foreign-registrations")
+)
 
 
 class Processor(object):
@@ -22,24 +26,28 @@ class Processor(object):
     CUTOFF_YEAR = datetime.datetime.utcnow().year - 95
 
     def __init__(self):
-        self.not_books_proper = open(
-            "output/3-registrations-not-books-proper.ndjson", "w"
+        self.not_books_proper = codec.Writer(
+            codec.path("output/3-registrations-not-books-proper")
         )
-        self.foreign = open("output/3-registrations-foreign.ndjson", "w")
-        self.previously_published = open(
-            "output/3-registrations-previously-published.ndjson", "w"
+        self.foreign = codec.Writer(codec.path("output/3-registrations-foreign"))
+        self.previously_published = codec.Writer(
+            codec.path("output/3-registrations-previously-published")
         )
-        self.too_old = open("output/3-registrations-too-early.ndjson", "w")
-        self.too_new = open("output/3-registrations-too-late.ndjson", "w")
-        self.in_range = open("output/3-registrations-in-range.ndjson", "w")
-        self.errors = open("output/3-registrations-error.ndjson", "w")
+        self.too_old = codec.Writer(codec.path("output/3-registrations-too-early"))
+        self.too_new = codec.Writer(codec.path("output/3-registrations-too-late"))
+        self.in_range = codec.Writer(codec.path("output/3-registrations-in-range"))
+        self.errors = codec.Writer(codec.path("output/3-registrations-error"))
         self.foreign_xrefs = defaultdict(list)
 
         self.output_for_uuid = dict()
 
-        for i in open("output/2-cross-references-in-foreign-registrations.ndjson"):
-            data = json.loads(i)
-            reg = Registration(**data)
+        self.parse = metrics.phase("parse")
+        self.classify = metrics.phase("classify")
+        self.serialize = metrics.phase("serialize")
+
+        for reg in Registration.load(
+            codec.path("output/2-cross-references-in-foreign-registrations")
+        ):
             for regnum in reg.regnums:
                 self.foreign_xrefs[regnum].append(reg)
         # self.cross_references_from_renewals = json.load(open(
@@ -97,7 +105,17 @@ class Processor(object):
         return self.in_range
 
     def process(self, data):
-        registration = Registration.from_json(data)
+        with self.parse:
+            registration = Registration.from_json(data)
+        with self.classify:
+            output = self.classify_registration(registration)
+        with self.serialize:
+            output.write(registration.jsonable(require_disposition=True))
+
+    def classify_registration(self, registration):
+        """Find the output a registration belongs in, taking its
+        parent into account.
+        """
         output = self.disposition(registration)
         if registration.uuid:
             self.output_for_uuid[registration.uuid] = output
@@ -123,20 +141,37 @@ class Processor(object):
                     "This registration seems okay, but it was associated with a registration which was a foreign publication, a previously published work, or out of range. To be safe, this registration will be put in the same category as its 'parent'; it should be checked manually."
                 )
                 output = parent_output
-
-        json.dump(registration.jsonable(require_disposition=True), output)
-        output.write("\n")
+        return output
 
     def error(self, registration, error):
         registration.disposition = "Error"
         registration.error = error
         return self.errors
 
+    def close(self):
+        for output in [
+            self.not_books_proper,
+            self.foreign,
+            self.previously_published,
+            self.too_old,
+            self.too_new,
+            self.in_range,
+            self.errors,
+        ]:
+            output.close()
+
 
 if __name__ == "__main__":
+    run = metrics.Metrics()
+    run.caches["dates"] = dates.stats
     processor = Processor()
     pbar = tqdm(unit_scale=True, desc="Filtering")
-    for i in open("output/2-registrations-with-renewals.ndjson"):
-        data = json.loads(i)
+    for data in run.timed(
+        "parse", codec.read(codec.path("output/2-registrations-with-renewals"))
+    ):
         processor.process(data)
         pbar.update(1)
+        run.count()
+    processor.close()
+    potentially_foreign.close()
+    run.finish()
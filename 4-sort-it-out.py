@@ -1,7 +1,7 @@
-import json
-
 from tqdm import tqdm
 
+import codec
+import metrics
 from model import Registration
 
 
@@ -9,13 +9,12 @@ class Output:
     COMPACT = True
 
     def __init__(self, base):
-        self.path = "output/FINAL-%s.ndjson" % base
-        self.out = open(self.path, "w")
+        self.path = codec.path("output/FINAL-%s" % base)
+        self.out = codec.Writer(self.path)
         self.count = 0
 
     def output(self, i):
-        json.dump(i.jsonable(compact=self.COMPACT), self.out)
-        self.out.write("\n")
+        self.out.write(i.jsonable(compact=self.COMPACT))
         self.count += 1
 
     def tally(self, total):
@@ -72,6 +71,9 @@ def destination(file, disposition):
 
 
 if __name__ == "__main__":
+    run = metrics.Metrics()
+    classify = run.phase("classify")
+    serialize = run.phase("serialize")
     in_range_outputs = [yes, probably, possibly, no, probably_not]
     all_outputs = [
         foreign,
@@ -100,15 +102,19 @@ if __name__ == "__main__":
         desc="Sorting to files",
         position=0,
     ):
-        path = "output/%s.ndjson"
-        with open(path % file) as f:
-            for i in tqdm(f,
-                          position=1,
-                          leave=False,
-                          desc=f"Processing file {file}"):
-                data = Registration.from_json(json.loads(i))
+        path = codec.path("output/%s" % file)
+        for data in tqdm(run.timed("parse", Registration.load(path)),
+                         position=1,
+                         leave=False,
+                         desc=f"Processing file {file}"):
+            with classify:
                 dest = destination(file, data.disposition)
+            with serialize:
                 dest.output(data)
+            run.count()
+    with serialize:
+        for output in all_outputs:
+            output.out.close()
 
     in_range_total = sum(x.count for x in in_range_outputs)
     grand_total = sum(x.count for x in all_outputs)
@@ -122,3 +128,4 @@ if __name__ == "__main__":
     for output in in_range_outputs:
         print(output.tally(in_range_total))
     print("Total: %s" % in_range_total)
+    run.finish()
@@ -1,5 +1,6 @@
-import json
 from pdb import set_trace
+import codec
+import metrics
 from model import Registration, Renewal
 import unicodecsv 
 class Spreadsheet(object):
@@ -12,9 +13,11 @@ class Spreadsheet(object):
 
     def convert(self, input_file):
         self.out.writerow(Registration.csv_row_labels + Renewal.csv_row_labels)
-        for line in open(input_file):
-            registration = Registration.from_json(json.loads(line))
-            self.out.writerow(registration.csv_row)
+        serialize = metrics.phase("serialize")
+        for registration in metrics.timed("parse", Registration.load(input_file)):
+            with serialize:
+                self.out.writerow(registration.csv_row)
+            metrics.count()
 
 spreadsheets = {
     "renewed" : ["renewed", "probably-renewed", "possibly-renewed"],
@@ -25,9 +28,11 @@ spreadsheets = {
 
 
 if __name__ == "__main__":
+    run = metrics.Metrics()
     for name, inputs in spreadsheets.items():
         output = "output/FINAL-%s.tsv" % name
         spreadsheet = Spreadsheet(output)
         for i in inputs:
-            filename = "output/FINAL-%s.ndjson" % i
+            filename = codec.path("output/FINAL-%s" % i)
             spreadsheet.convert(filename)
+    run.finish()
@@ -0,0 +1,36 @@
+"""Microbenchmark for Registration.from_tag.
+
+Run this from the top of the repository:
+
+    python -m benchmarks.from_tag
+
+It builds a volume of synthetic <copyrightEntry> tags and reports how
+long it takes to turn each one into JSON.
+"""
+import argparse
+import timeit
+
+from benchmarks.generate import volume
+from model import Registration
+
+
+def parse(tags):
+    for tag in tags:
+        for registration in Registration.from_tag(tag, include_extra=True):
+            registration.jsonable()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--entries", type=int, default=5000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    tags = volume(args.entries).xpath("//copyrightEntry")
+    best = min(
+        timeit.repeat(lambda: parse(tags), number=1, repeat=args.repeat)
+    )
+    print(
+        "Registration.from_tag: %.1f microseconds per entry (%d entries, best of %d)"
+        % (best / len(tags) * 1e6, len(tags), args.repeat)
+    )
@@ -0,0 +1,378 @@
+"""Seeded generators for synthetic CCE data.
+
+Everything here is made with a random.Random seeded by the caller, and
+nothing depends on the code being measured, so the same seed gives
+the same data on every commit.
+
+Run this from the top of the repository to write out a complete set
+of inputs for the scripts:
+
+    python -m benchmarks.generate /tmp/cce-synthetic --volumes 4
+
+That makes registrations/xml/, renewals/data/ and llm/ like the
+submodules, an Internet Archive catalog in
+output/ia-0-texts.ndjson, and a Hathifile in hathifile.tsv. Run the
+numbered scripts from that directory.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import shutil
+
+from lxml import etree
+
+WORDS = (
+    "the history of american life in modern times garden river secret "
+    "house mystery murder love letters poems collected works"
+).split()
+
+PLACES = ["New York", "Boston", "Chicago", "Garden City, N.Y.", "Philadelphia"]
+FOREIGN_PLACES = ["London", "Toronto, Canada", "Paris", "London, Eng."]
+
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+# The columns of a renewal TSV, as read by Renewal.from_dict.
+RENEWAL_COLUMNS = [
+    "entry_id", "oreg", "odat", "author", "titl", "id", "rdat",
+    "new_matter", "full_text", "claimants", "notes", "see_also_ren",
+    "see_also_reg",
+]
+
+# The columns of a Hathifile.
+HATHI_COLUMNS = [
+    "htid", "access", "rights", "ht_bib_key", "description", "source",
+    "source_bib_num", "oclc_num", "isbn", "issn", "lccn", "title",
+    "imprint", "rights_reason_code", "rights_timestamp",
+    "us_gov_doc_flag", "rights_date_used", "pub_place", "lang",
+    "bib_fmt", "collection_code", "content_provider_code",
+    "responsible_entity_code", "digitization_agent_code",
+    "access_profile_code", "author",
+]
+
+
+def words(rng, low=1, high=6):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def name(rng):
+    return "%s, %s" % (rng.choice(WORDS).title(), rng.choice(WORDS).title())
+
+
+def typo(rng, text):
+    """Change one letter of a string, the way OCR might."""
+    if not text:
+        return text
+    i = rng.randrange(len(text))
+    return text[:i] + rng.choice("aeiourstn") + text[i + 1:]
+
+
+def registration(rng, i, additional=True):
+    """Make up the data for one registration.
+
+    :param i: A number for the registration, unique within a run.
+    :param additional: Whether this one may have an <additionalEntry>.
+    """
+    year = rng.randint(1925, 1970)
+    data = dict(
+        id="e%d" % i,
+        regnum="A%d" % (100000 + i),
+        author=name(rng),
+        title=words(rng).capitalize(),
+        publisher=words(rng).title(),
+        place=rng.choice(FOREIGN_PLACES if rng.random() < 0.08 else PLACES),
+        year=year,
+        reg_date="%d-%02d-%02d" % (year, rng.randint(1, 12), rng.randint(1, 28)),
+        notes=[],
+        prev_pub=rng.random() < 0.03,
+        additional=None,
+    )
+    if rng.random() < 0.05:
+        data["regnum"] += " AF%d" % i
+    if rng.random() < 0.2:
+        data["notes"].append(words(rng))
+    if rng.random() < 0.03:
+        data["notes"].append("Prev. pub. abroad")
+    if additional and rng.random() < 0.2:
+        data["additional"] = registration(rng, i * 1000 + 1, additional=False)
+    return data
+
+
+def entry_xml(data, tag="copyrightEntry") -> str:
+    """Render a registration as a <copyrightEntry> or <additionalEntry>."""
+    xml = '<%s id="%s" regnum="%s">' % (tag, data["id"], data["regnum"])
+    xml += "<author><authorName>%s</authorName></author>" % data["author"]
+    xml += "<title>%s</title>" % data["title"]
+    xml += (
+        '<publisher><pubName claimant="yes">%s</pubName>'
+        "<pubPlace>%s</pubPlace>"
+        '<pubDate date="%s"/></publisher>'
+        % (data["publisher"], data["place"], data["reg_date"])
+    )
+    year, month, day = data["reg_date"].split("-")
+    if int(day) % 3:
+        xml += '<regDate date="%s"/>' % data["reg_date"]
+    else:
+        # Some registration dates are only written out, like '12Jun55'.
+        xml += "<regDate>%d%s%s</regDate>" % (
+            int(day), MONTHS[int(month) - 1], year[2:]
+        )
+    for note in data["notes"]:
+        xml += "<note>%s</note>" % note
+    if data["prev_pub"]:
+        xml += "<prevPub>%d</prevPub>" % (data["year"] - 1)
+    xml += "<edition>2d ed.</edition><lccn>%s</lccn>" % data["id"][1:]
+    if data["additional"]:
+        xml += entry_xml(data["additional"], "additionalEntry")
+    return xml + "</%s>" % tag
+
+
+def registrations(count, seed=0, first=0) -> list[dict]:
+    """Make up `count` registrations, numbered from `first`."""
+    rng = random.Random(seed)
+    return [registration(rng, i) for i in range(first, first + count)]
+
+
+def volume_xml(entries, year=1950) -> str:
+    """Render a list of registrations as a CCE volume.
+
+    Every tenth registration is put in an <entryGroup> with a
+    <crossRef> to it, and every eleventh is followed by a standalone
+    <crossRef>.
+    """
+    parts = [
+        '<?xml version="1.0"?><copyrightEntries>'
+        "<header><year>%d</year></header>" % year
+    ]
+    for i, data in enumerate(entries):
+        if i % 10 == 0:
+            parts.append(
+                "<entryGroup><author><authorName>%s</authorName></author>"
+                "<title>%s</title>%s"
+                '<crossRef><title>%s</title><see rid="%s"/></crossRef>'
+                "</entryGroup>"
+                % (data["author"], data["title"], entry_xml(data),
+                   data["title"].upper(), data["id"])
+            )
+        else:
+            parts.append(entry_xml(data))
+            if i % 11 == 0:
+                parts.append(
+                    "<crossRef><author><authorName>%s</authorName></author>"
+                    '<title>%s</title><see rid="%s"/></crossRef>'
+                    % (data["author"], data["title"], data["id"])
+                )
+        parts.append('<page n="%d"/>' % i)
+    parts.append("</copyrightEntries>")
+    return "".join(parts)
+
+
+def volume(entries, seed=0):
+    """A parsed volume of `entries` made-up registrations."""
+    return etree.fromstring(
+        volume_xml(registrations(entries, seed)).encode("utf8")
+    )
+
+
+def renewals(entries, seed=0, crowded=0.02) -> list[dict]:
+    """Make up renewal TSV rows for some of a list of registrations.
+
+    About half the registrations are renewed. Most renewals carry the
+    registration's number and date; some only get the year right, some
+    only the author or title, and some have no number at all.
+
+    :param crowded: The share of renewed registrations whose number
+        shows up on dozens of renewals, like the worst of the real
+        data.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i, data in enumerate(entries):
+        if rng.random() < 0.5:
+            continue
+        regnum = data["regnum"].split()[0]
+        date, author, title = data["reg_date"], data["author"], data["title"]
+        kind = rng.random()
+        if kind < 0.15:
+            # Only the year is right.
+            date = date[:4] + "-12-31"
+        elif kind < 0.25:
+            date = "%d-01-01" % rng.randint(1925, 1970)
+        elif kind < 0.35:
+            author = name(rng)
+        elif kind < 0.45:
+            title = "Other " + title
+        copies = 1
+        if rng.random() < crowded:
+            copies = rng.randint(20, 60)
+        for copy in range(copies):
+            renewal_id = "R%d" % (len(rows) + 1)
+            row = dict(
+                entry_id="u%d-%d" % (i, copy),
+                oreg=regnum if rng.random() < 0.9 else "",
+                odat=date if rng.random() < 0.95 else "",
+                author=author,
+                titl=title,
+                id=renewal_id,
+                rdat="%d-01-01" % (int(data["reg_date"][:4]) + 28),
+                new_matter="",
+                full_text="%s. By %s. © %s; %s. %s, 3Jan83, %s (A)"
+                % (title, author, data["reg_date"], regnum, renewal_id, author),
+                claimants=author,
+                notes="",
+                see_also_ren="",
+                see_also_reg="",
+            )
+            rows.append(row)
+    return rows
+
+
+def renewals_tsv(rows) -> str:
+    """Render renewal rows as a renewal TSV."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, RENEWAL_COLUMNS, dialect="excel-tab")
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+def llm_renewals(rows, seed=0, share=0.05) -> list[dict]:
+    """Make up language model corrections for some renewals, like
+    llm/renewals-from-lm.ndjson.
+    """
+    rng = random.Random(seed)
+    return [
+        dict(
+            uuid=row["entry_id"],
+            author=[row["author"]],
+            regnum=[row["oreg"]] if row["oreg"] else [],
+            title=row["titl"],
+            claimants=[row["claimants"]],
+        )
+        for row in rows
+        if rng.random() < share
+    ]
+
+
+def catalog_title(rng, data):
+    """The title of a registered book, as a catalog might have it."""
+    title = data["title"]
+    kind = rng.random()
+    if kind < 0.2:
+        title = typo(rng, title)
+    elif kind < 0.3:
+        title = title + " : " + words(rng, 1, 3)
+    elif kind < 0.4:
+        title = words(rng, 2, 5).capitalize()
+    return title
+
+
+def ia_texts(entries, count, seed=0) -> list[dict]:
+    """Make up Internet Archive catalog records, like
+    output/ia-0-texts.ndjson. Most of them are scans of books from the
+    list of registrations.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        data = rng.choice(entries)
+        year = data["year"] + rng.choice([0, 0, 0, 1, -1, 5])
+        record = dict(
+            identifier="text%d" % i,
+            title=catalog_title(rng, data),
+            creator=data["author"] if rng.random() < 0.8 else name(rng),
+            year=str(year),
+            date="%d-01-01T00:00:00Z" % year,
+            language="eng",
+            imagecount=rng.randint(50, 500),
+        )
+        if rng.random() < 0.05:
+            record["licenseurl"] = "http://creativecommons.org/licenses/by/4.0/"
+        if rng.random() < 0.1:
+            record["creator"] = [record["creator"], name(rng)]
+        records.append(record)
+    return records
+
+
+def hathifile(entries, count, seed=0) -> str:
+    """Make up a Hathifile. Most rows are books from the list of
+    registrations; the rest are out of range, public domain, or not
+    books at all.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        data = rng.choice(entries)
+        row = dict.fromkeys(HATHI_COLUMNS, "")
+        row.update(
+            htid="mdp.%08d" % i,
+            access="deny",
+            rights=rng.choice(["ic", "ic", "ic", "und", "pd", "pdus"]),
+            ht_bib_key=str(100000 + i),
+            source="MIU",
+            title=catalog_title(rng, data),
+            imprint=data["publisher"],
+            us_gov_doc_flag="0" if rng.random() < 0.95 else "1",
+            rights_date_used=str(data["year"]) if rng.random() < 0.95 else "9999",
+            pub_place="nyu",
+            lang="eng",
+            bib_fmt="BK" if rng.random() < 0.9 else "SE",
+            author=data["author"] if rng.random() < 0.9 else "",
+        )
+        lines.append("\t".join(row[x] for x in HATHI_COLUMNS) + "\n")
+    return "".join(lines)
+
+
+def write(directory, volumes=2, entries=1000, seed=0):
+    """Write a complete set of synthetic inputs under `directory`."""
+    rng = random.Random(seed)
+    xml_dir = os.path.join(directory, "registrations", "xml")
+    renewals_dir = os.path.join(directory, "renewals", "data")
+    for path in xml_dir, renewals_dir, os.path.join(directory, "llm"), os.path.join(
+        directory, "output"
+    ):
+        os.makedirs(path, exist_ok=True)
+
+    everything = []
+    all_renewals = []
+    for number in range(volumes):
+        entries_in_volume = registrations(
+            entries, rng.randrange(1 << 32), first=number * entries
+        )
+        everything.extend(entries_in_volume)
+        year = 1925 + number % 45
+        with open(os.path.join(xml_dir, "%d-v%d.xml" % (year, number)), "w") as f:
+            f.write(volume_xml(entries_in_volume, year))
+        rows = renewals(entries_in_volume, rng.randrange(1 << 32))
+        all_renewals.extend(rows)
+        with open(os.path.join(renewals_dir, "%d-r%d.tsv" % (year + 28, number)), "w") as f:
+            f.write(renewals_tsv(rows))
+
+    with open(os.path.join(directory, "llm", "renewals-from-lm.ndjson"), "w") as f:
+        for record in llm_renewals(all_renewals, rng.randrange(1 << 32)):
+            f.write(json.dumps(record) + "\n")
+    with open(os.path.join(directory, "output", "ia-0-texts.ndjson"), "w") as f:
+        for record in ia_texts(everything, len(everything) * 2, rng.randrange(1 << 32)):
+            f.write(json.dumps(record) + "\n")
+    with open(os.path.join(directory, "hathifile.tsv"), "w") as f:
+        f.write(hathifile(everything, len(everything) * 2, rng.randrange(1 << 32)))
+
+    # 3-filter.py looks for this in the current directory.
+    countries = os.path.join(os.path.dirname(os.path.dirname(__file__)), "countries.json")
+    copy = os.path.join(directory, "countries.json")
+    if not (os.path.exists(copy) and os.path.samefile(countries, copy)):
+        shutil.copy(countries, copy)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("directory", help="Where to write the data.")
+    arg_parser.add_argument("--volumes", type=int, default=2)
+    arg_parser.add_argument(
+        "--entries", type=int, default=1000, help="Registrations per volume."
+    )
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+    write(args.directory, args.volumes, args.entries, args.seed)
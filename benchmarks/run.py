@@ -0,0 +1,379 @@
+"""Time the hot path of each stage on synthetic data.
+
+Run this from the top of the repository:
+
+    python -m benchmarks.run --output before.json
+    (make a change)
+    python -m benchmarks.run --compare before.json
+
+The cases are:
+
+* from_tag: Registration.from_tag, the heart of 0-parse-registrations.py.
+* renewal_for: Comparator.renewal_for, the heart of 2-match-renewals.py.
+* best_renewal: Comparator.best_renewal on buckets of thousands of
+  renewals, like the most common regnums and titles in the real data.
+* disposition: Processor.disposition, the heart of 3-filter.py.
+* evaluate_match: Matcher.evaluate_match on every candidate a
+  registration's title turns up in an Internet Archive catalog.
+* matches: Matcher.matches, which scores a registration's candidates
+  all at once.
+
+The data comes from benchmarks.generate, so two runs with the same
+--seed and --entries measure the same work. benchmarks/run_test.py
+runs the same cases under pytest-benchmark. The report records the
+commit it was run on, along with the Python version and JSON backend,
+so reports from different commits can be compared. Each case is timed
+--repeat times and the best time counts, as with timeit.
+"""
+import argparse
+import contextlib
+import gc
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from abc import ABC, abstractmethod
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import codec
+from benchmarks import generate
+from compare import Comparator
+from matching import IASource, Matcher, normalize
+from model import Registration, Renewal
+
+
+class Case(ABC):
+    """A piece of code to time, and the data to time it on."""
+
+    name: str
+
+    def __init__(self, entries, seed):
+        self.entries = entries
+        self.seed = seed
+        # How many times run() calls the code being timed.
+        self.operations = 0
+
+    def setup(self):
+        """Get ready to run. This is called once, in a scratch
+        directory, and isn't timed.
+        """
+
+    def prepare(self):
+        """Get ready for one timed run."""
+
+    @abstractmethod
+    def run(self):
+        """Run the code being timed."""
+
+    def registrations(self) -> list[dict]:
+        """The synthetic registrations, as 0-parse-registrations.py
+        would write them.
+        """
+        tags = generate.volume(self.entries, self.seed).xpath("//copyrightEntry")
+        return [
+            registration.jsonable()
+            for tag in tags
+            for registration in Registration.from_tag(tag, include_extra=True)
+        ]
+
+
+class FromTag(Case):
+    name = "from_tag"
+
+    def setup(self):
+        self.tags = generate.volume(self.entries, self.seed).xpath("//copyrightEntry")
+        self.operations = len(self.tags)
+
+    def run(self):
+        for tag in self.tags:
+            for registration in Registration.from_tag(tag, include_extra=True):
+                registration.jsonable()
+
+
+class RenewalFor(Case):
+    name = "renewal_for"
+
+    def setup(self):
+        renewals_path = codec.path("output/1-parsed-renewals")
+        crossrefs_path = codec.path("output/0-parsed-registrations-crossRef")
+        entries = generate.registrations(self.entries, self.seed)
+        with codec.Writer(renewals_path) as out:
+            for row in generate.renewals(entries, self.seed):
+                out.write(Renewal.from_dict(row).jsonable())
+        with codec.Writer(crossrefs_path):
+            pass
+        self.paths = renewals_path, crossrefs_path
+        # This builds the renewal index, so prepare() only opens it.
+        self.comparator = Comparator(*self.paths)
+        self.data = self.registrations()
+        self.operations = len(self.data)
+
+    def prepare(self):
+        # renewal_for changes the registrations it looks at, and the
+        # Comparator keeps track of what it's matched, so each run
+        # starts over with both.
+        self.comparator = Comparator(*self.paths)
+        self.batch = [Registration.from_json(x) for x in self.data]
+
+    def run(self):
+        for registration in self.batch:
+            self.comparator.renewal_for(registration)
+
+
+class BestRenewal(RenewalFor):
+    name = "best_renewal"
+
+    # How many buckets to rank, and how many renewals go in each.
+    BUCKETS = 10
+    BUCKET_SIZE = 2000
+
+    def setup(self):
+        super().setup()
+        rng = random.Random(self.seed)
+        rows = generate.renewals(
+            generate.registrations(self.entries, self.seed), self.seed
+        )
+        self.buckets = []
+        for data in self.data:
+            if len(self.buckets) == self.BUCKETS:
+                break
+            registration = Registration.from_json(data)
+            dates = list(registration.registration_dates)
+            if not dates:
+                continue
+            # Half the renewals in the bucket have the registration's
+            # date, and the rest have to be checked by year, author
+            # and title.
+            bucket = []
+            for row in rng.choices(rows, k=self.BUCKET_SIZE):
+                if rng.random() < 0.5:
+                    row = dict(row, odat=dates[0].isoformat()[:10])
+                bucket.append(Renewal.from_dict(row))
+            self.buckets.append((registration, bucket))
+        self.operations = len(self.buckets)
+
+    def prepare(self):
+        pass
+
+    def run(self):
+        for registration, bucket in self.buckets:
+            self.comparator.best_renewal(registration, bucket)
+
+
+class Disposition(Case):
+    name = "disposition"
+
+    def setup(self):
+        with codec.Writer(
+            codec.path("output/2-cross-references-in-foreign-registrations")
+        ):
+            pass
+        self.processor = importlib.import_module("3-filter").Processor()
+        self.data = self.registrations()
+        self.operations = len(self.data)
+
+    def prepare(self):
+        self.batch = [Registration.from_json(x) for x in self.data]
+
+    def run(self):
+        for registration in self.batch:
+            self.processor.disposition(registration)
+
+
+class EvaluateMatch(Case):
+    name = "evaluate_match"
+
+    def setup(self):
+        path = codec.path("output/ia-0-texts")
+        entries = generate.registrations(self.entries, self.seed)
+        with codec.Writer(path) as out:
+            out.write_all(generate.ia_texts(entries, self.entries * 2, self.seed))
+        self.matcher = Matcher(IASource(path))
+        self.batch = [
+            Registration.from_json(x) for x in self.registrations() if x.get("title")
+        ]
+        self.pairs = []
+        for registration in self.batch:
+            title = normalize(registration.title)
+            for candidate in self.matcher.blocker.candidates(title):
+                self.pairs.append((candidate, registration, title))
+        self.operations = len(self.pairs)
+
+    def run(self):
+        evaluate_match = self.matcher.evaluate_match
+        for candidate, registration, title in self.pairs:
+            evaluate_match(candidate, registration, title)
+
+
+class Matches(EvaluateMatch):
+    name = "matches"
+
+    def setup(self):
+        super().setup()
+        self.operations = len(self.batch)
+
+    def run(self):
+        for registration in self.batch:
+            for match in self.matcher.matches(registration):
+                pass
+
+
+CASES = {
+    cls.name: cls
+    for cls in (FromTag, RenewalFor, BestRenewal, Disposition, EvaluateMatch, Matches)
+}
+
+
+def measure(case, repeat) -> list[float]:
+    """Time a case `repeat` times, with the garbage collector off."""
+    times = []
+    for _ in range(repeat):
+        case.prepare()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            case.run()
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return times
+
+
+def git(*args) -> str | None:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """Describe what the benchmarks ran on."""
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return dict(
+        commit=git("rev-parse", "HEAD"),
+        dirty=bool(status) if status is not None else None,
+        date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        system=platform.system(),
+        cpus=os.cpu_count(),
+        format=codec.FORMAT,
+        json=codec.JSON_BACKEND,
+    )
+
+
+@contextlib.contextmanager
+def workspace():
+    """Work in a scratch directory. The scripts use paths relative to
+    the current directory.
+    """
+    here = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="cce-benchmarks-")
+    try:
+        os.chdir(directory)
+        os.mkdir("output")
+        shutil.copy(os.path.join(ROOT, "countries.json"), directory)
+        yield directory
+    finally:
+        os.chdir(here)
+        shutil.rmtree(directory)
+
+
+def run(names, entries, seed, repeat) -> dict:
+    report = environment()
+    report.update(entries=entries, seed=seed, repeat=repeat, cases={})
+    with workspace():
+        for name in names:
+            case = CASES[name](entries, seed)
+            case.setup()
+            times = measure(case, repeat)
+            best = min(times)
+            report["cases"][name] = dict(
+                operations=case.operations,
+                best=best,
+                median=statistics.median(times),
+                microseconds_per_operation=(
+                    best / case.operations * 1e6 if case.operations else None
+                ),
+            )
+            print(
+                "%s: %.1f microseconds per operation (%d operations, best of %d)"
+                % (name, report["cases"][name]["microseconds_per_operation"] or 0,
+                   case.operations, repeat),
+                file=sys.stderr,
+            )
+    return report
+
+
+def compare(old, new):
+    """Print how each case changed between two reports."""
+    if (old["entries"], old["seed"]) != (new["entries"], new["seed"]):
+        print(
+            "Warning: the reports were made with different --entries or"
+            " --seed, so they measured different work.",
+            file=sys.stderr,
+        )
+    print("%-16s %12s %12s %8s" % ("case", "before (us)", "after (us)", "change"))
+    for name, after in new["cases"].items():
+        before = old["cases"].get(name)
+        if not before or not before["microseconds_per_operation"]:
+            print("%-16s %12s %12.1f" % (name, "-", after["microseconds_per_operation"]))
+            continue
+        ratio = after["microseconds_per_operation"] / before["microseconds_per_operation"]
+        print(
+            "%-16s %12.1f %12.1f %+7.1f%%"
+            % (name, before["microseconds_per_operation"],
+               after["microseconds_per_operation"], (ratio - 1) * 100)
+        )
+    print(
+        "before: %s, after: %s"
+        % ((old.get("commit") or "?")[:10], (new.get("commit") or "?")[:10])
+    )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "cases",
+        nargs="*",
+        help="Cases to run: %s. Defaults to all of them." % ", ".join(CASES),
+    )
+    arg_parser.add_argument(
+        "--entries", type=int, default=2000, help="Registrations to generate."
+    )
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--output", help="Write the JSON report here.")
+    arg_parser.add_argument(
+        "--compare", help="Compare the results with this earlier report."
+    )
+    args = arg_parser.parse_args()
+    unknown = [x for x in args.cases if x not in CASES]
+    if unknown:
+        arg_parser.error(
+            "unknown case %s; choose from %s"
+            % (", ".join(unknown), ", ".join(CASES))
+        )
+
+    report = run(args.cases or list(CASES), args.entries, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,34 @@
+# The cases in benchmarks/run.py, under pytest-benchmark:
+#
+#     pytest benchmarks/run_test.py --benchmark-autosave
+#     (make a change)
+#     pytest benchmarks/run_test.py --benchmark-compare
+#
+# The data is kept small so these also work as a quick check that the
+# benchmarks still run. Set CCE_BENCHMARK_ENTRIES for more.
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks import run
+
+ENTRIES = int(os.environ.get("CCE_BENCHMARK_ENTRIES", 200))
+
+
+@pytest.fixture(scope="module")
+def workspace():
+    with run.workspace() as directory:
+        yield directory
+
+
+@pytest.mark.parametrize("name", list(run.CASES))
+def test_case(benchmark, workspace, name):
+    case = run.CASES[name](ENTRIES, seed=0)
+    case.setup()
+    assert case.operations
+    benchmark.extra_info["operations"] = case.operations
+    benchmark.pedantic(
+        case.run, setup=case.prepare, rounds=3, warmup_rounds=0
+    )
@@ -0,0 +1,307 @@
+# Candidate generation ("blocking") for the IA and Hathi matching
+# scripts.
+#
+# Comparing every registration against every scanned book would take
+# forever, so each book is filed under a few keys derived from its
+# normalized title. A registration is only compared against the books
+# that share at least one key with it.
+#
+# The matching scripts have always used a single key: the two longest
+# words of the title. That's LongestWords, and it's still the default.
+# It misses a book if one of those two words is misspelled on either
+# side, and a common pair of words makes a huge bucket. The other
+# strategies here are there to catch what it misses:
+#
+# * TokenPrefix files a title under every pair of its three longest
+#   words, so one misspelled word still leaves a pair in common.
+# * QGramLSH is MinHash locality-sensitive hashing over the character
+#   trigrams of the title. Titles that share most of their trigrams
+#   are likely to share a key, however the words are spelled.
+# * Phonetic uses the Soundex codes of the two longest words, which
+#   survive a lot of OCR and typing mistakes.
+#
+# Strategies can be combined; a book that shows up under more than one
+# key is only compared once. Every strategy but LongestWords ignores
+# buckets bigger than its max_bucket -- a key shared by that many
+# books doesn't say much, and comparing against all of them is where
+# the time goes. Blocker.stats() shows how big the buckets are.
+import random
+import zlib
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from itertools import combinations
+
+
+def title_key(normalized_title, size=2) -> tuple[str, ...]:
+    """The longest words of a title, longest first."""
+    words = [x for x in normalized_title.split(" ") if x]
+    longest_words = sorted(words, key=lambda x: (-len(x), x))
+    return tuple(longest_words[:size])
+
+
+class Strategy(ABC):
+    """A way of turning a normalized title into blocking keys."""
+
+    name: str
+
+    # Don't look in buckets bigger than this. None means no limit.
+    max_bucket: int | None = None
+
+    @abstractmethod
+    def keys(self, title) -> list:
+        """The keys to file a normalized title under."""
+
+    def __repr__(self):
+        return "<%s>" % self.name
+
+
+class LongestWords(Strategy):
+    """The longest words of the title, as a single key."""
+
+    name = "longest"
+
+    def __init__(self, size=2, max_bucket=None):
+        self.size = size
+        self.max_bucket = max_bucket
+
+    def keys(self, title) -> list:
+        return [title_key(title, self.size)]
+
+
+class TokenPrefix(Strategy):
+    """Every pair of words from the `size` longest distinct words
+    of the title.
+    """
+
+    name = "prefix"
+
+    def __init__(self, size=3, max_bucket=200):
+        self.size = size
+        self.max_bucket = max_bucket
+
+    def keys(self, title) -> list:
+        words = sorted(
+            set(x for x in title.split(" ") if x), key=lambda x: (-len(x), x)
+        )[: self.size]
+        if len(words) < 2:
+            return [tuple(words)]
+        return list(combinations(words, 2))
+
+
+class QGramLSH(Strategy):
+    """MinHash LSH over the character q-grams of the title.
+
+    Each title gets `bands` keys of `rows` min-hashes apiece. Two
+    titles whose sets of q-grams have a Jaccard similarity of s share
+    at least one key with probability 1 - (1 - s**rows) ** bands:
+    about 96% for s=0.8 and 32% for s=0.5, with the defaults.
+    """
+
+    name = "minhash"
+
+    # A Mersenne prime bigger than any CRC-32.
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, q=3, bands=6, rows=4, seed=0, max_bucket=200):
+        self.q = q
+        self.bands = bands
+        self.rows = rows
+        self.max_bucket = max_bucket
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, self.PRIME), rng.randrange(self.PRIME))
+            for _ in range(bands * rows)
+        ]
+
+    def grams(self, title) -> set[str]:
+        title = " %s " % title
+        if len(title) <= self.q:
+            return {title}
+        return {title[i : i + self.q] for i in range(len(title) - self.q + 1)}
+
+    def signature(self, title) -> list[int]:
+        hashes = [zlib.crc32(gram.encode("utf8")) for gram in self.grams(title)]
+        prime = self.PRIME
+        return [min([(a * h + b) % prime for h in hashes]) for a, b in self.permutations]
+
+    def keys(self, title) -> list:
+        signature = self.signature(title)
+        rows = self.rows
+        return [
+            (band, tuple(signature[band * rows : (band + 1) * rows]))
+            for band in range(self.bands)
+        ]
+
+
+SOUNDEX_CODES = {
+    letter: str(digit)
+    for digit, letters in enumerate(("bfpv", "cgjkqsxz", "dt", "l", "mn", "r"), 1)
+    for letter in letters
+}
+
+
+def soundex(word) -> str:
+    """The American Soundex code for a word, e.g. 'R163' for 'robert'.
+
+    Anything that isn't an ASCII letter is left out; a word with no
+    letters at all is its own code.
+    """
+    letters = [c for c in word.lower() if "a" <= c <= "z"]
+    if not letters:
+        return word
+    code = letters[0].upper()
+    last = SOUNDEX_CODES.get(letters[0], "")
+    for c in letters[1:]:
+        digit = SOUNDEX_CODES.get(c, "")
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        if c not in "hw":
+            # H and W don't separate two letters with the same code;
+            # vowels do.
+            last = digit
+    return code.ljust(4, "0")
+
+
+class Phonetic(Strategy):
+    """The Soundex codes of the longest words of the title."""
+
+    name = "soundex"
+
+    def __init__(self, size=2, max_bucket=200):
+        self.size = size
+        self.max_bucket = max_bucket
+
+    def keys(self, title) -> list:
+        return [tuple(sorted(soundex(x) for x in title_key(title, self.size)))]
+
+
+STRATEGIES = {
+    cls.name: cls for cls in (LongestWords, TokenPrefix, QGramLSH, Phonetic)
+}
+
+
+def strategies(names) -> list[Strategy]:
+    """Turn a comma-separated list of strategy names, like
+    'longest,prefix', into strategies with their default settings.
+    """
+    found = []
+    for name in names.split(","):
+        name = name.strip()
+        if name not in STRATEGIES:
+            raise ValueError(
+                "Unknown blocking strategy %r. Choose from: %s"
+                % (name, ", ".join(STRATEGIES))
+            )
+        found.append(STRATEGIES[name]())
+    return found
+
+
+def add_arguments(arg_parser):
+    """Add the blocking options to a matching script's arguments."""
+    arg_parser.add_argument(
+        "--blocking",
+        type=strategies,
+        default=LongestWords.name,
+        help="Comma-separated blocking strategies to find candidates with."
+        " Choose from: %s" % ", ".join(STRATEGIES),
+    )
+    arg_parser.add_argument(
+        "--max-bucket",
+        type=int,
+        default=None,
+        help="Ignore blocking keys shared by more than this many items,"
+        " for every strategy.",
+    )
+
+
+def from_arguments(args) -> list[Strategy]:
+    """The strategies asked for on the command line."""
+    if args.max_bucket is not None:
+        for strategy in args.blocking:
+            strategy.max_bucket = args.max_bucket
+    return args.blocking
+
+
+class Blocker:
+    """Files items under the blocking keys of their titles, and finds
+    the candidates for a title.
+    """
+
+    def __init__(self, strategies=None):
+        self.strategies = list(strategies or [LongestWords()])
+        self.items = []
+        self.buckets = [defaultdict(list) for _ in self.strategies]
+
+        self.queries = 0
+        self.comparisons = 0
+        self.skipped = [0 for _ in self.strategies]
+
+    def add(self, item, title):
+        """File an item under the keys for its normalized title."""
+        item_id = len(self.items)
+        self.items.append(item)
+        for strategy, buckets in zip(self.strategies, self.buckets):
+            for key in set(strategy.keys(title)):
+                buckets[key].append(item_id)
+
+    def candidates(self, title) -> list:
+        """Find every item that shares a key with this normalized title.
+
+        Each item shows up once, in the order it was added.
+        """
+        found = set()
+        for i, (strategy, buckets) in enumerate(zip(self.strategies, self.buckets)):
+            for key in strategy.keys(title):
+                bucket = buckets.get(key)
+                if not bucket:
+                    continue
+                if strategy.max_bucket is not None and len(bucket) > strategy.max_bucket:
+                    self.skipped[i] += 1
+                    continue
+                found.update(bucket)
+        self.queries += 1
+        self.comparisons += len(found)
+        items = self.items
+        return [items[x] for x in sorted(found)]
+
+    @staticmethod
+    def distribution(sizes) -> dict[str, int]:
+        """Count bucket sizes in powers of two: '1', '2-3', '4-7', ..."""
+        counts = defaultdict(int)
+        for size in sizes:
+            low = 1 << (size.bit_length() - 1)
+            high = low * 2 - 1
+            counts[str(low) if low == high else "%d-%d" % (low, high)] += 1
+        return dict(sorted(counts.items(), key=lambda x: int(x[0].split("-")[0])))
+
+    def stats(self) -> dict:
+        """Describe the buckets, and how many comparisons the lookups
+        so far have led to.
+        """
+        strategies = {}
+        for strategy, buckets, skipped in zip(
+            self.strategies, self.buckets, self.skipped
+        ):
+            sizes = [len(x) for x in buckets.values()]
+            strategies[strategy.name] = dict(
+                buckets=len(sizes),
+                largest=max(sizes, default=0),
+                mean=sum(sizes) / len(sizes) if sizes else 0,
+                too_big=sum(
+                    1 for x in sizes
+                    if strategy.max_bucket is not None and x > strategy.max_bucket
+                ),
+                lookups_skipped=skipped,
+                sizes=self.distribution(sizes),
+            )
+        return dict(
+            items=len(self.items),
+            queries=self.queries,
+            comparisons=self.comparisons,
+            comparisons_per_query=(
+                self.comparisons / self.queries if self.queries else 0
+            ),
+            strategies=strategies,
+        )
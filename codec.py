@@ -0,0 +1,212 @@
+# Read and write the files of records passed from one stage to the
+# next.
+#
+# By default each record is a line of JSON. Set the CCE_FORMAT
+# environment variable to "msgpack" to store them as MessagePack
+# instead; that needs the msgspec package (pip install msgspec).
+# MessagePack files are smaller and much faster to decode, which
+# matters because every stage reads millions of records. The format
+# of an existing file is determined by its extension, so the
+# setting only affects which files get written.
+#
+# JSON is handled by orjson or msgspec if one of them is installed,
+# falling back to the standard library. They all read each other's
+# output, but they don't write byte-identical files: orjson and
+# msgspec leave out the spaces and don't escape non-ASCII characters.
+# Set CCE_JSON to "orjson", "msgspec" or "json" to pick one.
+import json
+import os
+
+FORMAT = os.environ.get("CCE_FORMAT", "ndjson")
+
+# Records are encoded and written this many at a time.
+BATCH_SIZE = 1000
+BUFFER_SIZE = 1024 * 1024
+
+EXTENSIONS = {
+    "ndjson": ".ndjson",
+    "msgpack": ".msgpack",
+}
+if FORMAT not in EXTENSIONS:
+    raise ValueError(
+        "Unknown CCE_FORMAT %r; use one of %s" % (FORMAT, ", ".join(EXTENSIONS))
+    )
+
+
+def path(base) -> str:
+    """Add the extension for the current format to a filename."""
+    return base + EXTENSIONS[FORMAT]
+
+
+def format_for(path) -> str:
+    """Figure out a file's format from its extension."""
+    for format, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            return format
+    raise ValueError("Can't tell what format %s is in." % path)
+
+
+def _msgspec():
+    try:
+        import msgspec
+    except ImportError:
+        raise ImportError(
+            "The msgpack format needs the msgspec package: pip install msgspec"
+        )
+    return msgspec
+
+
+def _json_backend():
+    """Pick the fastest JSON library available."""
+    choice = os.environ.get("CCE_JSON")
+    for name in [choice] if choice else ["orjson", "msgspec", "json"]:
+        if name == "json":
+            return name
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            if choice:
+                raise ImportError(
+                    "CCE_JSON is set to %s, but it isn't installed." % name
+                )
+    raise ValueError("Unknown CCE_JSON %r; use orjson, msgspec or json" % choice)
+
+
+JSON_BACKEND = _json_backend()
+
+
+def _json_encoder(sort_keys=False):
+    """Find a function that turns a record into a line of JSON, as bytes."""
+    if JSON_BACKEND == "orjson":
+        import orjson
+
+        options = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+
+        def encode_line(record):
+            return orjson.dumps(record, option=options)
+
+    elif JSON_BACKEND == "msgspec":
+        import msgspec
+
+        encode = msgspec.json.Encoder(order="sorted" if sort_keys else None).encode
+
+        def encode_line(record):
+            return encode(record) + b"\n"
+
+    else:
+
+        def encode_line(record):
+            return (json.dumps(record, sort_keys=sort_keys) + "\n").encode("utf8")
+
+    return encode_line
+
+
+def _json_decoder():
+    """Find a function that turns a line of JSON into a record."""
+    if JSON_BACKEND == "orjson":
+        import orjson
+
+        return orjson.loads
+    elif JSON_BACKEND == "msgspec":
+        import msgspec
+
+        return msgspec.json.Decoder().decode
+    return json.loads
+
+
+def encoder(format, sort_keys=False):
+    """Find a function that turns a record into bytes ready to be written
+    to a file in the given format.
+    """
+    if format == "msgpack":
+        encode = _msgspec().msgpack.Encoder(
+            order="sorted" if sort_keys else None
+        ).encode
+
+        def encode_framed(record):
+            # MessagePack has no record separator, so each record is
+            # preceded by its length.
+            data = encode(record)
+            return len(data).to_bytes(4, "little") + data
+
+        return encode_framed
+
+    return _json_encoder(sort_keys)
+
+
+def decoder(format):
+    """Find a function that turns one unframed record back into Python
+    objects.
+    """
+    if format == "msgpack":
+        return _msgspec().msgpack.Decoder().decode
+    return _json_decoder()
+
+
+def read(path):
+    """Iterate over the records in a file."""
+    format = format_for(path)
+    decode = decoder(format)
+    with open(path, "rb", buffering=BUFFER_SIZE) as f:
+        if format == "msgpack":
+            while size := f.read(4):
+                yield decode(f.read(int.from_bytes(size, "little")))
+        else:
+            for line in f:
+                if line.strip():
+                    yield decode(line)
+
+
+class Writer:
+    """Write records to a file in the format its extension calls for.
+
+    Encoded records are held back and written out BATCH_SIZE at a
+    time, so nothing is guaranteed to be on disk until the writer is
+    flushed or closed.
+    """
+
+    def __init__(self, path, sort_keys=False, append=False):
+        self.path = path
+        self.encode = encoder(format_for(path), sort_keys=sort_keys)
+        self.out = open(path, "ab" if append else "wb", buffering=BUFFER_SIZE)
+        self.pending = []
+
+    def write(self, record):
+        self.pending.append(self.encode(record))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def write_encoded(self, records):
+        """Write records that were already run through encoder()."""
+        self.flush()
+        self.out.writelines(records)
+
+    def flush(self, sync=False):
+        """Write out everything that's pending.
+
+        :param sync: Also wait until the operating system has put it
+            on disk.
+        """
+        if self.pending:
+            self.out.write(b"".join(self.pending))
+            self.pending = []
+        self.out.flush()
+        if sync:
+            os.fsync(self.out.fileno())
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
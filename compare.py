@@ -1,59 +1,35 @@
-import json
-from collections import defaultdict
-from dateutil import parser
+from collections import Counter, defaultdict
+import codec
 from model import Registration, Renewal
-import logging
+from renewal_index import INDEX, RenewalIndex
 
-logger = logging.getLogger('server_logger')
-
-# create a file handler
-file_handler = logging.FileHandler("logs.txt")
-
-# add the file handler to the logger
-logger.addHandler(file_handler)
-
-# set the log level
-logger.setLevel(logging.DEBUG)
 
 class Comparator:
-    def __init__(self, renewals_input_path):
-        self.renewals = defaultdict(list)
-        self.renewals_by_title = defaultdict(list)
+    def __init__(
+        self,
+        renewals_input_path,
+        crossrefs_input_path=codec.path("output/0-parsed-registrations-crossRef"),
+        index_path=INDEX,
+    ):
+        # The renewals and crossRefs are looked up in an on-disk
+        # index, which is built the first time it's needed.
+        self.index = RenewalIndex.open(
+            renewals_input_path, crossrefs_input_path, index_path
+        )
+        self.renewals = self.index.renewals
+        self.renewals_by_title = self.index.renewals_by_title
+        # Renewal.renewal_key is made of Registration objects, which
+        # are only equal to themselves, so looking up a registration's
+        # (title, author) key never finds anything. There's no point
+        # in indexing them.
         self.renewals_by_key = defaultdict(list)
         # groups are not used. Doesn't seem to be a consistent grouping.
         self.group_match = defaultdict(list)
-        self.crossrefs = defaultdict(list)
         self.REGNUMS_MATCHED: list["Renewal"] | None = []
-
-        # get registration crossrefs as well
-        with open(
-            "/Users/baber/PycharmProjects/cce-python/output/0-parsed-registrations-crossRef.ndjson",
-            "rt",
-        ) as fc:
-            for i in fc:
-                res = {}
-                cross = json.loads(i)
-                cross_uuid = cross.get("uuid")
-                res["authors"] = cross.get("authors")
-                res["title"] = cross.get("title")
-                if cross_uuid:
-                    self.crossrefs[cross_uuid].append(res)
-
-        with open(renewals_input_path, "rt") as f:
-            for i in f:
-                renewal = Renewal(**json.loads(i))
-                regnum = renewal.regnum
-                if not regnum:
-                    regnum = []
-                if not isinstance(regnum, list):
-                    regnum = [regnum]
-                for r in regnum:
-                    r = (r or "").replace("-", "")
-                    self.renewals[r].append(renewal)
-                title = Registration._normalize_text(renewal.title) or renewal.title
-                self.renewals_by_title[title].append(renewal)
-                self.renewals_by_key[renewal.renewal_key].append(renewal)
-            self.used_renewals = set()
+        self.used_renewals = set()
+        # How many registrations turned up each number of renewals by
+        # regnum.
+        self.renewal_counts = Counter()
 
     def renewal_for(self, registration):
         """Find a renewal for this registration.
@@ -64,11 +40,10 @@ class Comparator:
         renewal = None
         for regnum in registration.regnums:
             regnum = regnum.replace("-", "")
-            if regnum in self.renewals:
-                renewals.extend(self.renewals[regnum])
+            renewals.extend(self.renewals[regnum])
             self.REGNUMS_MATCHED = renewals[:]
         if renewals:
-            logger.debug(f"{len(renewals)}")
+            self.renewal_counts[len(renewals)] += 1
             # this used to ignore duplicates
             renewals, disposition = zip(*self.best_renewal(registration, renewals))
             registration.disposition = disposition
@@ -94,28 +69,26 @@ class Comparator:
                 )
 
         if all(value is None for value in renewals):
-            if registration.uuid in self.crossrefs:
-                crosses = self.crossrefs[registration.uuid]
-                for x in crosses:
-                    if cross_a := x.get("authors"):
-                        if (
-                            cross_a not in registration.authors
-                            or cross_a not in registration.title
-                            or cross_a not in x.get("title")
-                        ):
-                            registration.authors.extend(x.get("authors"))
-                    if cross_t := x.get("title"):
-                        if cross_t not in registration.authors:
-                            registration.title = cross_t
-                    key = registration.renewal_key
-                    renewals_for_key = self.renewals_by_key[key]
-                    if renewals_for_key:
-                        renewals, disposition = zip(
-                            *self.best_renewal(registration, renewals_for_key)
-                        )
-                        registration.disposition = (
-                            "Possibly renewed, based solely on title/author match."
-                        )
+            for x in self.index.crossrefs(registration.uuid):
+                if cross_a := x.get("authors"):
+                    if (
+                        cross_a not in registration.authors
+                        or cross_a not in registration.title
+                        or cross_a not in x.get("title")
+                    ):
+                        registration.authors.extend(x.get("authors"))
+                if cross_t := x.get("title"):
+                    if cross_t not in registration.authors:
+                        registration.title = cross_t
+                key = registration.renewal_key
+                renewals_for_key = self.renewals_by_key[key]
+                if renewals_for_key:
+                    renewals, disposition = zip(
+                        *self.best_renewal(registration, renewals_for_key)
+                    )
+                    registration.disposition = (
+                        "Possibly renewed, based solely on title/author match."
+                    )
 
         if all(value is None for value in renewals):
             # We'll count it as a tentative match if there has _ever_ been a renewal
@@ -149,70 +122,73 @@ class Comparator:
 
         return renewals
 
+    @staticmethod
+    def _year(year):
+        """Turn a registration's year into an int, if it's written as
+        one, so it can be compared with the years of renewal dates.
+        """
+        try:
+            if str(int(year)) == year:
+                return int(year)
+        except (TypeError, ValueError):
+            pass
+        return year
+
     def best_renewal(self, registration, renewals) -> list[tuple[Renewal | None, str]]:
+        """Rank the renewals that might be for this registration.
+
+        Each renewal is matched on the strongest thing it has in common
+        with the registration: a registration date, a registration
+        year, the author or the title. A renewal is listed once for
+        every date or year that matches.
+
+        :return: A list of (renewal, disposition) 2-tuples, with the
+            date matches first and the title matches last.
+        """
         # Find a renewal based on a registration date match.
-        possibilities = [x.isoformat()[:10] for x in registration.registration_dates]
-        output_renewals = []
-        matched_indices = []
-        for i, renewal in enumerate(renewals):
-            for date in renewal.reg_date:
-                if date in possibilities:
-                    # A very strong match.
-                    output_renewals.append((renewal, "Renewed. (Date match.)"))
-                    matched_indices.append(i)
-                    # return [renewal], "Renewed. (Date match.)"
-
-        # let's look at just the year
-        if not len(matched_indices) == len(renewals):
-            possibilities = []
-            for x in registration.registration_dates:
-                if x:
-                    possibilities.append(str(x.year))
-            if not possibilities:
-                possibilities = [registration.year]
-            for i, renewal in enumerate(renewals):
-                if i in matched_indices:
-                    pass
-                else:
-                    for date in renewal.reg_date:
-                        try:
-                            date = str(parser.parse(date).year)
-                        except:
-                            pass
-                        if date in possibilities:
-                            output_renewals.append(
-                                (renewal, "Probably renewed. (Year match.)")
-                            )
-                            matched_indices.append(i)
-
-        # for i, renewal in enumerate(renewals):
-        #
-        #     for date in renewal.reg_date:
-
-        # At this point we have multiple renewals and no date matches.
-        # Try an author match.
-        for i, renewal in enumerate(renewals):
-            if i in matched_indices:
-                pass
-            else:
-                if registration.author_match(renewal.author):
-                    matched_indices.append(i)
-                    output_renewals.append(
-                        (renewal, "Probably renewed. (Author match.)")
-                    )
-                    # return [renewal], "Probably renewed. (Author match.)"
-
-        # That didn't work. Try a title match.
-        for i, renewal in enumerate(renewals):
-            if i in matched_indices:
-                pass
-            else:
-                if registration.title_match(renewal.title):
-                    output_renewals.append(
-                        (renewal, "Probably renewed. (Title match.)")
+        possibilities = {x.isoformat()[:10] for x in registration.registration_dates}
+        date_matches = [
+            sum(1 for date in renewal.reg_date if date in possibilities)
+            for renewal in renewals
+        ]
+
+        # let's look at just the year, unless the number of date matches
+        # adds up to the number of renewals. (A renewal with two
+        # matching dates counts twice.)
+        years = None
+        if sum(date_matches) != len(renewals):
+            years = {x.year for x in registration.registration_dates if x}
+            if not years:
+                years = {self._year(registration.year)}
+
+        # Each renewal goes in the group for the strongest match it
+        # has, so each one is looked at once.
+        by_date, by_year, by_author, by_title = [], [], [], []
+        for renewal, matches in zip(renewals, date_matches):
+            if matches:
+                # A very strong match.
+                by_date.extend([(renewal, "Renewed. (Date match.)")] * matches)
+                continue
+            if years is not None:
+                # A date we couldn't get a year out of is compared
+                # as-is.
+                matches = sum(
+                    1
+                    for date, year in zip(renewal.reg_date, renewal.registration_years)
+                    if (date if year is None else year) in years
+                )
+                if matches:
+                    by_year.extend(
+                        [(renewal, "Probably renewed. (Year match.)")] * matches
                     )
-                    matched_indices.append(i)
-                    # return [renewal], "Probably renewed. (Title match.)"
+                    continue
+            # No date matches. Try an author match, then a title match.
+            if registration.author_match(renewal.author):
+                by_author.append((renewal, "Probably renewed. (Author match.)"))
+            elif registration.title_match(renewal.title):
+                by_title.append((renewal, "Probably renewed. (Title match.)"))
+
+        output_renewals = by_date + by_year + by_author + by_title
         if output_renewals:
             return output_renewals
         else:
@@ -0,0 +1,9 @@
+# The scripts expect to be run from the top of the repository, where
+# countries.json and output/ are, so the tests are too.
+import os
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+# together_test.py is a script that sends registrations to a hosted
+# language model, not a test.
+collect_ignore = ["together_test.py"]
@@ -0,0 +1,199 @@
+# Parse the dates found in registrations and renewals.
+#
+# Nearly all of them are in one of three formats: '1950-06-12',
+# '1950-06' or '12Jun50'. Those are parsed with a regular expression.
+# Anything else goes through dateutil, and the result is kept in an
+# LRU cache -- the same few thousand odd strings show up over and
+# over again.
+#
+# Both paths give exactly the same answers dateutil would. That
+# includes dateutil's habit of filling in a missing day from today's
+# date, so a cached answer for '1950-06' can be a day out of date
+# if a run goes past midnight.
+import calendar
+import datetime
+import re
+from functools import lru_cache
+
+from dateutil import parser as date_parser
+
+CACHE_SIZE = 1024 * 64
+
+ISO_DATE = re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2})")
+YEAR_MONTH = re.compile(r"([0-9]{4})-([0-9]{2})")
+DAY_MONTH_YEAR = re.compile(
+    r"([0-9]{1,2})(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)([0-9]{2})"
+)
+MONTHS = {
+    name: number
+    for number, name in enumerate(calendar.month_abbr)
+    if name
+}
+
+# How many dates were handled by the regular expressions.
+fast = 0
+
+
+def stats() -> dict:
+    """How the dates parsed so far in this process were handled."""
+    parse_info = _parse.cache_info()
+    year_info = _year.cache_info()
+    return _stats(
+        fast,
+        parse_info.hits + year_info.hits,
+        parse_info.misses + year_info.misses,
+    )
+
+
+def combine(stats) -> dict:
+    """Add up the stats() of several processes."""
+    stats = list(stats)
+    return _stats(
+        sum(x["fast"] for x in stats),
+        sum(x["cached"] for x in stats),
+        sum(x["parsed"] for x in stats),
+    )
+
+
+def _stats(fast, cached, parsed) -> dict:
+    total = fast + cached + parsed
+    return dict(
+        fast=fast,
+        cached=cached,
+        parsed=parsed,
+        hit_rate=(fast + cached) / total if total else None,
+    )
+
+
+def _two_digit_year(year) -> int:
+    """Put a two-digit year in the century dateutil would: within 50
+    years of the current year.
+    """
+    this_year = datetime.date.today().year
+    year += this_year // 100 * 100
+    if year >= this_year + 50:
+        year -= 100
+    elif year < this_year - 50:
+        year += 100
+    return year
+
+
+def _fast_parse(raw) -> tuple[int, int, int] | None:
+    """Find the (year, month, day) dateutil would find in one of the
+    common formats, or None if the string is anything else.
+    """
+    if match := ISO_DATE.fullmatch(raw):
+        year, month, day = map(int, match.groups())
+    elif match := YEAR_MONTH.fullmatch(raw):
+        year, month = map(int, match.groups())
+        if not 1000 <= year <= 9999 or not 1 <= month <= 12:
+            return None
+        # dateutil takes the day from today's date, but not past the
+        # end of the month.
+        day = min(datetime.date.today().day, calendar.monthrange(year, month)[1])
+    elif match := DAY_MONTH_YEAR.fullmatch(raw):
+        day, month, year = match.groups()
+        day, month, year = int(day), MONTHS[month], _two_digit_year(int(year))
+    else:
+        return None
+    if (
+        not 1000 <= year <= 9999
+        or not 1 <= month <= 12
+        or not 1 <= day <= calendar.monthrange(year, month)[1]
+    ):
+        # dateutil would reject this, or try something clever.
+        return None
+    return year, month, day
+
+
+def parse(raw) -> datetime.datetime | None:
+    """Parse a date from a registration.
+
+    Two-digit years like '19Jun58' are put in the 1900s, and dates
+    outside 1900-1995 are rejected as probably not being dates at all.
+
+    :return: A datetime, or None if it's not a plausible date.
+    """
+    global fast
+    if isinstance(raw, str):
+        found = _fast_parse(raw)
+        if found:
+            year, month, day = found
+            if year > 2000 and len(raw) in (6, 7):
+                year -= 100
+            if 1900 <= year <= 1995 and (
+                month != 2 or day != 29 or calendar.isleap(year)
+            ):
+                fast += 1
+                return datetime.datetime(year, month, day)
+        return _parse(raw)
+    return _parse.__wrapped__(raw)
+
+
+def parse_many(raws) -> list[datetime.datetime | None]:
+    """Parse a column of dates, parsing each distinct string once."""
+    parsed = {raw: parse(raw) for raw in set(raws)}
+    return [parsed[raw] for raw in raws]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(raw) -> datetime.datetime | None:
+    parsed = None
+    # Try to parse the full date, and parse just the year and
+    # month if that fails. In most cases that's all we really
+    # need.
+    attempts = [raw]
+    if len(raw) > 7 and raw[7] == "-":
+        attempts.append(raw[:7])
+    for attempt in attempts:
+        try:
+            parsed = date_parser.parse(attempt)
+            if not parsed:
+                continue
+            if parsed.year > 2000 and len(raw) in (6, 7):
+                # A very common date format is '19Jun58',
+                # which date_parser parses as 2059. Subtract
+                # 100 years and we're in business.
+                parsed = datetime.datetime(
+                    parsed.year - 100, parsed.month, parsed.day
+                )
+            if parsed.year > 1995 or parsed.year < 1900:
+                # This is most likely a totally incorrect date, or
+                # not a date at all.
+                parsed = None
+            else:
+                break
+        except ValueError:
+            continue
+    return parsed
+
+
+def year(raw) -> int | None:
+    """Find the year of a date from a renewal, or None if it can't be
+    parsed.
+
+    Unlike parse(), this takes dateutil's word for it: '19Jun58' is in
+    2058 and there's no sanity check.
+    """
+    global fast
+    if isinstance(raw, str):
+        found = _fast_parse(raw)
+        if found:
+            fast += 1
+            return found[0]
+        return _year(raw)
+    return _year.__wrapped__(raw)
+
+
+def years(raws) -> list[int | None]:
+    """Find the year of each date in a column of dates."""
+    found = {raw: year(raw) for raw in set(raws)}
+    return [found[raw] for raw in raws]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _year(raw) -> int | None:
+    try:
+        return date_parser.parse(raw).year
+    except Exception:
+        return None
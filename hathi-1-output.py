@@ -1,8 +1,8 @@
 import unicodecsv 
 from pdb import set_trace
+import codec
 from model import Registration
 from collections import Counter
-import json
 import sys
 if len(sys.argv) > 1:
     cutoff = float(sys.argv[1])
@@ -33,8 +33,7 @@ class Package(object):
         out.writerow([])
 
 packages = []
-for i in open("output/hathi-0-matched.ndjson"):
-    data = json.loads(i)
+for data in codec.read("output/hathi-0-matched.ndjson"):
     quality = data['quality']
     if quality < cutoff:
         continue
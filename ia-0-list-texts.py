@@ -1,14 +1,49 @@
+# Download basic information about every scanned text in the Internet
+# Archive from its scrape API.
+#
+# The number of texts varies a lot from year to year, so the date
+# range is first split up into shards of about SHARD_SIZE texts each:
+# a range with too many texts is split in half, down to a single
+# month if necessary. The shards go into a queue that MAX_CONCURRENT
+# downloads work through.
+# The counts are retried if the server won't give them; if it still
+# won't, the script stops before saving a plan.
+#
+# Each shard is written to its own file in WORK_DIR as the pages come
+# in, and the cursor for the next page is saved after every page. If
+# the script is interrupted, running it again picks up each shard
+# where it left off. Once every shard is complete, the files are put
+# together into output/ia-0-texts.ndjson and WORK_DIR is removed.
+#
+# Use --base-url to point the script at something other than the real
+# scrape API, such as a local fake for testing.
+import argparse
 import asyncio
+import calendar
 import datetime
 import json
-from asyncio import Semaphore
-from pathlib import Path
+import os
+import shutil
 
 import aiohttp
 from tqdm.asyncio import tqdm
 
+import codec
+
 MAX_CONCURRENT = 4
 COUNT = 10000
+SHARD_SIZE = 50000
+# How many times to ask again for a count, and how many seconds to
+# wait first.
+COUNT_RETRIES = 3
+RETRY_DELAY = 1
+
+BASE_URL = "https://archive.org/services/search/v1/scrape"
+OUTPUT = "output/ia-0-texts.ndjson"
+WORK_DIR = "output/ia-0-texts.parts"
+# The list of shards, so a resumed run uses the same ones even if the
+# counts have changed since.
+SHARDS = "shards.json"
 
 
 class PaginatedRequest:
@@ -17,24 +52,28 @@ class PaginatedRequest:
             session: aiohttp.client.ClientSession,
             start_date: str,
             end_date: str,
-            params: dict = None
+            params: dict = None,
+            cursor: str = None,
+            base_url: str = BASE_URL,
     ):
         self.retries = 0
         self.session = session
         self.max_retries = 3
         self.start_date = start_date
         self.end_date = end_date
-        self.base_url = "https://archive.org/services/search/v1/scrape"
+        self.base_url = base_url
         if params:
             self.params = params
         else:
             self.params = dict(
-                q=f"date:[{self.start_date} TO {self.end_date}] and mediatype:texts",
+                q=query(self.start_date, self.end_date),
                 count=str(COUNT),
                 fields="identifier,date,year,creator,language,title,licenseurl,call_number,createddate,imagecount,stars,avg_rating,creatorSorter,titleSorter,publicdate",
                 sorts="publicdate desc",
             )
-        self.cursor = None
+        self.cursor = cursor
+        # Set if the server gave up on us before the last page.
+        self.failed = False
 
     async def fetch_pages(self):
         while True:
@@ -52,9 +91,12 @@ class PaginatedRequest:
                         # Reset retries counter on successful fetch or after hitting max retries
                         self.retries = 0
 
+                        # Move the cursor on before handing over the
+                        # page, so a checkpoint taken once the page has
+                        # been written points at the next page.
+                        self.cursor = data.get("cursor")
                         # Yield items if available or after max retries to prevent infinite loop
                         yield items
-                        self.cursor = data.get("cursor")
                         if not self.cursor:
                             break
                     else:
@@ -66,69 +108,251 @@ class PaginatedRequest:
                     print(
                         f"Error fetching page: HTTP Status {response.status} - {response.reason}"
                     )
+                    self.failed = True
                     break
 
 
-def split_dates(split: int = MAX_CONCURRENT) -> list[tuple[str, str]]:
-    cutoff_year = datetime.datetime.now(datetime.UTC).year - 95 - 10
-    start_year = cutoff_year
+def query(start_date: str, end_date: str) -> str:
+    return f"date:[{start_date} TO {end_date}] and mediatype:texts"
+
+
+def date_range() -> tuple[str, str]:
+    """The whole range of dates to download."""
+    start_year = datetime.datetime.now(datetime.UTC).year - 95 - 10
     end_year = 1973  # Fixed end year
+    return f"{start_year}-01-01", f"{end_year}-12-31"
 
-    # Calculate the total period and divide into 10 intervals
-    total_years = end_year - start_year
-    interval_length = total_years // split
-
-    # Generate non-overlapping date ranges
-    return_dates = []
-    for i in range(split):
-        interval_start = start_year + i * interval_length
-        # Ensure the last interval goes up to the end_year
-        if i == split - 1:
-            interval_end = end_year
-        else:
-            interval_end = (
-                    start_year + (i + 1) * interval_length - 1
-            )  # Subtract 1 to avoid overlap
-        return_dates.append((f"{interval_start}-01-01", f"{interval_end}-12-31"))
 
-    return return_dates
+def split_range(start_date: str, end_date: str) -> list[tuple[str, str]]:
+    """Split a range of whole years in half by year, or a range of
+    months in a single year in half by month.
+
+    :return: Two date ranges, or the original range if it's a single
+        month and can't be split any further.
+    """
+    start = datetime.date.fromisoformat(start_date)
+    end = datetime.date.fromisoformat(end_date)
+    if start.year != end.year:
+        middle = (start.year + end.year) // 2
+        return [
+            (start_date, f"{middle}-12-31"),
+            (f"{middle + 1}-01-01", end_date),
+        ]
+    if start.month != end.month:
+        year = start.year
+        middle = (start.month + end.month) // 2
+        last_day = calendar.monthrange(year, middle)[1]
+        return [
+            (start_date, f"{year}-{middle:02}-{last_day}"),
+            (f"{year}-{middle + 1:02}-01", end_date),
+        ]
+    return [(start_date, end_date)]
 
 
-async def process_pages(semaphore, paginated_request: PaginatedRequest, pbar: tqdm) -> list:
+async def count(session, start_date: str, end_date: str, base_url: str = BASE_URL) -> int:
+    """Ask how many texts there are in a date range.
+
+    The shard plan is saved and reused, so a count that's missing
+    would leave a range unsplit for good. If the server won't say,
+    ask again a few times and then give up.
+    """
+    params = dict(q=query(start_date, end_date), total_only="true")
+    for attempt in range(COUNT_RETRIES + 1):
+        if attempt:
+            print(f"Retry {attempt}/{COUNT_RETRIES} for count of {start_date} to {end_date}.")
+            await asyncio.sleep(RETRY_DELAY)
+        async with session.get(base_url, params=params) as response:
+            if response.status != 200:
+                problem = f"HTTP Status {response.status} - {response.reason}"
+                continue
+            data = await response.json()
+            if data.get("total") is not None:
+                return data["total"]
+            problem = "no total in the response"
+    raise Exception(
+        f"Couldn't count the texts from {start_date} to {end_date}: {problem}"
+    )
+
+
+async def plan_shards(
+        session, semaphore, start_date: str, end_date: str,
+        shard_size: int = SHARD_SIZE, base_url: str = BASE_URL
+) -> list[dict]:
+    """Split a date range until no piece has more than shard_size
+    texts in it, or it can't be split any further.
+
+    :return: A list of dicts with the start date, end date and number
+        of texts in each shard, in date order.
+    """
     async with semaphore:
-        items = []  # List to accumulate JSON items
+        total = await count(session, start_date, end_date, base_url)
+    halves = split_range(start_date, end_date)
+    if total <= shard_size or len(halves) == 1:
+        return [dict(start=start_date, end=end_date, count=total)]
+    shards = []
+    for plan in await asyncio.gather(*(
+        plan_shards(session, semaphore, start, end, shard_size, base_url)
+        for start, end in halves
+    )):
+        shards.extend(plan)
+    return shards
+
+
+class Part:
+    """The file one date range is downloaded into, and the checkpoint
+    that says how far the download got.
+    """
+
+    def __init__(self, start_date: str, end_date: str, work_dir: str = WORK_DIR):
+        base = os.path.join(work_dir, f"{start_date}--{end_date}")
+        self.path = base + ".ndjson"
+        self.checkpoint_path = base + ".checkpoint"
+
+    def checkpoint(self) -> dict:
+        """Find out where the last run left off.
+
+        :return: A dict with the cursor for the next page, the size of
+            the file when it was saved, and whether the range is done.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return dict(cursor=None, size=0, done=False)
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, cursor, size, done):
+        # Write the new checkpoint next to the old one and swap it in,
+        # so there's always a whole checkpoint on disk.
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(cursor=cursor, size=size, done=done), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def open(self, size) -> codec.Writer:
+        """Open the file to append to, throwing away anything written
+        after the checkpoint was saved.
+        """
+        if os.path.exists(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+        return codec.Writer(self.path, append=True)
+
+
+async def process_pages(
+        session, part: Part, start_date: str, end_date: str, pbar: tqdm,
+        base_url: str = BASE_URL
+) -> bool:
+    """Download one date range into its part file.
+
+    :return: Whether the whole date range has been downloaded.
+    """
+    checkpoint = part.checkpoint()
+    if checkpoint["done"]:
+        return True
+    paginated_request = PaginatedRequest(
+        session=session, start_date=start_date, end_date=end_date,
+        cursor=checkpoint["cursor"], base_url=base_url,
+    )
+    with part.open(checkpoint["size"]) as out:
         async for page in paginated_request.fetch_pages():
             for item in page:
                 if item is not None:
-                    json_item = json.dumps(item) + "\n"
-                    items.append(json_item)
+                    out.write(item)
                     pbar.update(1)
-        return items
+            # Make sure the page is on disk before the checkpoint
+            # says it is.
+            out.flush(sync=True)
+            part.save_checkpoint(
+                paginated_request.cursor,
+                os.path.getsize(part.path),
+                not paginated_request.cursor,
+            )
+    return not paginated_request.cursor and not paginated_request.failed
+
 
+def assemble(parts: list[Part], output: str = OUTPUT):
+    """Put the part files together, in date order."""
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as out:
+        for part in parts:
+            if os.path.exists(part.path):
+                with open(part.path, "rb") as f:
+                    shutil.copyfileobj(f, out)
+    os.replace(tmp, output)
 
-async def main():
-    date_ranges = split_dates()
-    semaphore = Semaphore(MAX_CONCURRENT)
-    res = []
+
+async def main(
+        base_url: str = BASE_URL,
+        concurrency: int = MAX_CONCURRENT,
+        shard_size: int = SHARD_SIZE,
+        work_dir: str = WORK_DIR,
+        output: str = OUTPUT,
+) -> bool:
+    """Download everything that hasn't been downloaded yet.
+
+    :return: Whether everything has been downloaded.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    shards_path = os.path.join(work_dir, SHARDS)
     async with aiohttp.ClientSession() as session:
-        with tqdm(total=2146141, desc="Fetching pages") as pbar:
-            tasks = [
-                asyncio.create_task(
-                    process_pages(semaphore,
-                                  PaginatedRequest(session=session, start_date=start, end_date=end), pbar
-                                  )
-                )
-                for start, end in date_ranges
-            ]
-            results = await asyncio.gather(*tasks)
-            for items in results:
-                res.extend(items)
-    return res
+        if os.path.exists(shards_path):
+            with open(shards_path) as f:
+                shards = json.load(f)
+        else:
+            start, end = date_range()
+            shards = await plan_shards(
+                session, asyncio.Semaphore(concurrency), start, end,
+                shard_size, base_url
+            )
+            with open(shards_path, "w") as f:
+                json.dump(shards, f)
+
+        parts = [Part(x["start"], x["end"], work_dir) for x in shards]
+        queue = asyncio.Queue()
+        for part, shard in zip(parts, shards):
+            queue.put_nowait((part, shard))
+        results = []
+
+        async def work(pbar):
+            while not queue.empty():
+                part, shard = queue.get_nowait()
+                results.append(await process_pages(
+                    session, part, shard["start"], shard["end"], pbar, base_url
+                ))
+
+        total = sum(x["count"] or 0 for x in shards)
+        with tqdm(total=total or None, desc="Fetching pages") as pbar:
+            await asyncio.gather(*(work(pbar) for _ in range(concurrency)))
+    if not all(results):
+        return False
+    assemble(parts, output)
+    shutil.rmtree(work_dir)
+    return True
 
 
 if __name__ == "__main__":
-    all_items = asyncio.run(main())
-    output = Path("output/ia-0-texts.ndjson")
-    output.parent.mkdir(parents=True, exist_ok=True)
-    with open(output, "w") as file:
-        file.writelines(all_items)
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=MAX_CONCURRENT,
+        help="Number of shards to download at once.",
+    )
+    arg_parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=SHARD_SIZE,
+        help="Split date ranges with more texts than this.",
+    )
+    arg_parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="URL of the scrape API.",
+    )
+    args = arg_parser.parse_args()
+    if not asyncio.run(main(args.base_url, args.concurrency, args.shard_size)):
+        print(
+            f"Some date ranges didn't finish downloading. Run this again"
+            f" to pick up where it left off; the progress so far is in {WORK_DIR}."
+        )
@@ -1,10 +1,163 @@
+# Search the Internet Archive for each registration that wasn't
+# renewed: once by title, and if that finds anything, once more per
+# registration date within five years of the date.
+#
+# Registrations are searched --workers at a time, over one shared HTTP
+# connection pool, and no more than --rate searches a second are sent
+# to the server. Every search result is kept in an SQLite cache keyed
+# by the query, so a rerun -- or a second registration with the same
+# title -- never sends the same search twice. A search that fails
+# isn't cached.
+#
+# Records are appended to the output file in the order they were read,
+# as soon as they're done, so an interrupted run can pick up where it
+# left off.
+#
+# Use --base-url to point the script at something other than the real
+# Internet Archive, such as a local mock server for testing.
+import argparse
 import datetime
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
 from dateutil import parser as date_parser
-from pdb import set_trace
 import internetarchive as ia
-import os
-import json
-from model import Registration
+import codec
+
+WORKERS = 4
+RATE = 5
+CACHE = "output/ia-0-search-cache.sqlite"
+
+
+class RateLimiter:
+    """A token bucket: allows `rate` calls a second on average, and
+    bursts of up to `burst` calls.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until a call is allowed."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class SearchCache:
+    """Search results on disk, keyed by query.
+
+    The cache is shared between threads. If a query is already being
+    sent by one thread, another thread that wants it waits for the
+    answer rather than sending it again.
+    """
+
+    def __init__(self, path=CACHE):
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, results BLOB)"
+        )
+        self.encode = codec.encoder("ndjson")
+        self.decode = codec.decoder("ndjson")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query, search):
+        """Find the results for a query, calling search(query) if
+        they're not in the cache.
+
+        search() returns a 2-tuple (results, complete). Incomplete
+        results are passed on but not cached.
+        """
+        with self.lock:
+            waiting = self.pending.get(query)
+            if waiting is None:
+                row = self.db.execute(
+                    "SELECT results FROM searches WHERE query = ?", (query,)
+                ).fetchone()
+                if row is not None:
+                    self.hits += 1
+                    return self.decode(row[0])
+                self.misses += 1
+                self.pending[query] = future = Future()
+            else:
+                self.hits += 1
+        if waiting is not None:
+            return waiting.result()
+
+        try:
+            results, complete = search(query)
+            if complete:
+                with self.lock:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO searches VALUES (?, ?)",
+                        (query, self.encode(results)),
+                    )
+            future.set_result(results)
+            return results
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[query]
+
+    def close(self):
+        self.db.close()
+
+
+class PooledSession(ia.session.ArchiveSession):
+    """An ArchiveSession whose connections are kept between searches.
+
+    ia.search.Search mounts a new HTTPAdapter on its session every time
+    one is created, which throws away the connections already open.
+    This session mounts one adapter, with room for `pool_size`
+    connections, and keeps it.
+
+    mount_http_adapter isn't a documented hook, so this depends on how
+    internetarchive works inside. It was written against
+    internetarchive 5.11.1; ia_0_search_test.py checks that the adapter
+    survives a run of searches.
+    """
+
+    def __init__(self, pool_size=WORKERS, base_url=None):
+        self.mounted = False
+        super().__init__()
+        if base_url:
+            url = urlsplit(base_url)
+            self.protocol = url.scheme + ":"
+            self.host = url.netloc
+        self.http_adapter_kwargs["pool_connections"] = pool_size
+        self.http_adapter_kwargs["pool_maxsize"] = pool_size
+        # The same retries Search would have asked for.
+        self.mount_http_adapter(max_retries=5, host=self.host)
+        self.mounted = True
+
+    def mount_http_adapter(self, *args, **kwargs):
+        if not self.mounted:
+            super().mount_http_adapter(*args, **kwargs)
 
 
 class IAClient(object):
@@ -13,37 +166,53 @@ class IAClient(object):
 
     _session = None
 
-    def __init__(self, output_file):
+    def __init__(self, output_file, cache=None, rate_limiter=None, workers=WORKERS):
         self.done = set()
         if os.path.exists(output_file):
-            with open(output_file, "rt") as f:
-                for i in f:
-                    data = json.loads(i)
-                    if "uuid" in data:
-                        self.done.add(data['uuid'])
+            for data in codec.read(output_file):
+                if "uuid" in data:
+                    self.done.add(data['uuid'])
             self.out = output_file
         else:
             raise Exception("No such file or directory: " + output_file)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.workers = workers
 
     def process(self, input_file):
-        with open(input_file, "rt") as input_file:
-            for i in input_file:
-                data = json.loads(i)
-                disposition = data['disposition']
-                if disposition.startswith('Renewed'):
+        records = (
+            data for data in codec.read(input_file)
+            if not data['disposition'].startswith('Renewed')
+        )
+        with codec.Writer(self.out, append=True) as f, ThreadPoolExecutor(
+            self.workers
+        ) as executor:
+            # Keep a few records per worker in flight, and write them
+            # out in the order they were read.
+            in_flight = deque()
+            for data in records:
+                if data['uuid'] in self.done:
                     continue
-                self.process_data(data)
-                with open(self.out, "a") as f:
-                    json.dump(data, f)
-                    f.write("\n")
+                in_flight.append(executor.submit(self.process_data, data))
+                if len(in_flight) >= self.workers * 2:
+                    self.write(f, in_flight.popleft().result())
+            while in_flight:
+                self.write(f, in_flight.popleft().result())
+
+    @staticmethod
+    def write(f, data):
+        # Flush each record as soon as it's done, so an interrupted
+        # run can pick up where it left off.
+        f.write(data)
+        f.flush()
 
     def process_data(self, data):
         uuid = data['uuid']
         if uuid in self.done:
-            return
+            return data
         title, authors = data['title'], data['authors']
         if not title:
-            return
+            return data
         reg_dates = [
             date_parser.parse(x['_normalized']) for x in data['reg_dates']
         ]
@@ -65,13 +234,33 @@ class IAClient(object):
                 query, results = self.search(title, reg_date)
                 search_data[query] = results
                 print("%s: %s" % (query, len(results)))
+        return data
 
     def search(self, title, date):
         query = self.query(title, date)
-
-        results = list(self._search(query))
+        if self.cache is None:
+            results, complete = self.fetch(query)
+        else:
+            results = self.cache.get(query, self.fetch)
         return query, results
 
+    def fetch(self, query):
+        """Send a search to the server.
+
+        :return: A 2-tuple (results, complete). If the search failed
+            partway through, complete is False.
+        """
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        results = []
+        try:
+            for i in self._search(query):
+                results.append(i)
+        except Exception as e:
+            print(e)
+            return results, False
+        return results, True
+
     @classmethod
     def session(cls, set_to=None):
         """Keep one ArchiveSession object for the whole program.
@@ -107,14 +296,43 @@ class IAClient(object):
             params=dict(count=100, page=1),
             **kwargs
         )
-        try:
-            for i in search.iter_as_results():
-                yield i
-        except Exception as e:
-            print(e)
-            return
+        return search.iter_as_results()
 
 
 if __name__ == "__main__":
-    client = IAClient("output/ia-0-searches.ndjson")
-    client.process("output/3-registrations-in-range.ndjson")
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="Number of searches to run at once.",
+    )
+    arg_parser.add_argument(
+        "--rate",
+        type=float,
+        default=RATE,
+        help="Maximum number of searches to send per second.",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        default=CACHE,
+        help="SQLite file to keep search results in.",
+    )
+    arg_parser.add_argument(
+        "--base-url",
+        default=None,
+        help="Send searches to this server instead of the Internet Archive.",
+    )
+    args = arg_parser.parse_args()
+
+    IAClient.session(PooledSession(args.workers, args.base_url))
+    cache = SearchCache(args.cache)
+    client = IAClient(
+        "output/ia-0-searches.ndjson",
+        cache=cache,
+        rate_limiter=RateLimiter(args.rate),
+        workers=args.workers,
+    )
+    client.process(codec.path("output/3-registrations-in-range"))
+    print("Search cache: %d hits, %d misses" % (cache.hits, cache.misses))
+    cache.close()
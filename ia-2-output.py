@@ -1,10 +1,8 @@
-from pathlib import Path
-
 import unicodecsv
 from pdb import set_trace
+import codec
 from model import Registration
 from collections import Counter
-import json
 import sys
 
 if len(sys.argv) > 1:
@@ -39,8 +37,7 @@ class Package(object):
 
 if __name__ == "__main__":
     packages = []
-    for i in Path("output/ia-1-matched.ndjson").open():
-        data = json.loads(i)
+    for data in codec.read("output/ia-1-matched.ndjson"):
         quality = data['quality']
         if quality < cutoff:
             continue
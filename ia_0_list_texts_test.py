@@ -0,0 +1,173 @@
+import asyncio
+import datetime
+import importlib
+import json
+import os
+import random
+import re
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+pytest.importorskip("tqdm")
+list_texts = importlib.import_module("ia-0-list-texts")
+
+ITEMS = 3040
+PAGE = 100
+SHARD_SIZE = 400
+
+
+class FakeScrapeAPI:
+    """Just enough of the scrape API for ia-0-list-texts.py: total_only
+    counts, and pages of items with a cursor to the next page.
+
+    If fail_at is set, that request fails with a 500 error, once. The
+    first fail_counts total_only requests fail the same way.
+    """
+
+    QUERY = re.compile(r"date:\[(\S+) TO (\S+)\]")
+
+    def __init__(self, fail_at=None, fail_counts=0):
+        start, end = list_texts.date_range()
+        start_year, end_year = int(start[:4]), int(end[:4])
+        rng = random.Random(0)
+        # More texts in later years, and a quarter of them in 1950, so
+        # some shards are decades long and 1950 is split into months.
+        self.items = []
+        for i in range(ITEMS):
+            if rng.random() < 0.25:
+                year = 1950
+            else:
+                year = int(rng.triangular(start_year, end_year + 1, end_year - 10))
+            date = datetime.date(year, rng.randint(1, 12), rng.randint(1, 28))
+            self.items.append(dict(identifier="item%04d" % i, date=date.isoformat()))
+        self.requests = 0
+        self.fail_at = fail_at
+        self.fail_counts = fail_counts
+
+    def matching(self, q) -> list[dict]:
+        start, end = self.QUERY.search(q).groups()
+        return [x for x in self.items if start <= x["date"] <= end]
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.requests == self.fail_at:
+            self.fail_at = None
+            return web.Response(status=500)
+        params = request.query
+        items = self.matching(params["q"])
+        if params.get("total_only") == "true":
+            if self.fail_counts:
+                self.fail_counts -= 1
+                return web.Response(status=500)
+            return web.json_response(dict(total=len(items)))
+        start = int(params.get("cursor", 0))
+        end = start + int(params["count"])
+        page = dict(items=items[start:end], count=len(items[start:end]))
+        if end < len(items):
+            page["cursor"] = str(end)
+        return web.json_response(page)
+
+    async def run(self, **kwargs) -> bool:
+        """Run ia-0-list-texts.py's main() against this server."""
+        app = web.Application()
+        app.router.add_get("/scrape", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            return await list_texts.main(
+                base_url="http://127.0.0.1:%d/scrape" % port,
+                shard_size=SHARD_SIZE,
+                **kwargs,
+            )
+        finally:
+            await runner.cleanup()
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(list_texts, "COUNT", PAGE)
+    monkeypatch.setattr(list_texts, "RETRY_DELAY", 0)
+    return dict(work_dir=str(tmp_path / "parts"), output=str(tmp_path / "texts.ndjson"))
+
+
+def expected(api, paths) -> list[str]:
+    """Every item, once, in shard order."""
+    with open(paths["work_dir"] + "/" + list_texts.SHARDS) as f:
+        shards = json.load(f)
+    assert all(x["count"] <= SHARD_SIZE for x in shards)
+    # 1950 had to be split into months.
+    assert ["1950-01-01", "1950-03-31"] in [[x["start"], x["end"]] for x in shards]
+    return [
+        x["identifier"]
+        for shard in shards
+        for x in api.matching(list_texts.query(shard["start"], shard["end"]))
+    ]
+
+
+def identifiers(path) -> list[str]:
+    with open(path) as f:
+        return [json.loads(line)["identifier"] for line in f]
+
+
+def test_resume_after_server_error(paths):
+    api = FakeScrapeAPI(fail_at=40)
+    assert not asyncio.run(api.run(concurrency=2, **paths))
+    shards = expected(api, paths)
+
+    assert asyncio.run(api.run(concurrency=2, **paths))
+    found = identifiers(paths["output"])
+    assert len(found) == ITEMS
+    assert found == shards
+
+
+def test_resume_after_crash(paths, monkeypatch):
+    # Die after writing a page but before saving its checkpoint. The
+    # page gets downloaded again, and the copy from before the crash
+    # is thrown away.
+    api = FakeScrapeAPI()
+    save_checkpoint = list_texts.Part.save_checkpoint
+    saved = []
+
+    def crash(part, *args):
+        if len(saved) == 10:
+            raise KeyboardInterrupt()
+        saved.append(args)
+        save_checkpoint(part, *args)
+
+    monkeypatch.setattr(list_texts.Part, "save_checkpoint", crash)
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(api.run(concurrency=1, **paths))
+    shards = expected(api, paths)
+
+    monkeypatch.setattr(list_texts.Part, "save_checkpoint", save_checkpoint)
+    assert asyncio.run(api.run(concurrency=3, **paths))
+    found = identifiers(paths["output"])
+    assert len(found) == ITEMS
+    assert found == shards
+
+
+def test_count_is_retried(paths, tmp_path):
+    # The very first count is for the whole date range. If it were
+    # taken as small enough, the range would be a single shard, and
+    # the items would come out in a different order.
+    api = FakeScrapeAPI(fail_counts=list_texts.COUNT_RETRIES)
+    assert asyncio.run(api.run(concurrency=2, **paths))
+
+    clean = dict(work_dir=str(tmp_path / "clean"), output=str(tmp_path / "clean.ndjson"))
+    assert asyncio.run(FakeScrapeAPI().run(concurrency=2, **clean))
+    assert identifiers(paths["output"]) == identifiers(clean["output"])
+
+
+def test_no_plan_is_saved_without_counts(paths):
+    api = FakeScrapeAPI(fail_counts=list_texts.COUNT_RETRIES + 1)
+    with pytest.raises(Exception, match="Couldn't count"):
+        asyncio.run(api.run(concurrency=2, **paths))
+    assert not os.path.exists(os.path.join(paths["work_dir"], list_texts.SHARDS))
+
+    # The next run plans the shards from scratch.
+    assert asyncio.run(api.run(concurrency=2, **paths))
+    assert len(identifiers(paths["output"])) == ITEMS
@@ -0,0 +1,177 @@
+import importlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+pytest.importorskip("internetarchive")
+search = importlib.import_module("ia-0-search")
+
+import codec
+
+
+class MockSearchServer(ThreadingHTTPServer):
+    """A stand-in for archive.org's advancedsearch.php.
+
+    A title with "hit" in it finds two texts; a title with "fail" in it
+    gets an error. (Not a 5xx error, which internetarchive would retry
+    for a minute first.) Every query is counted, and answered after a
+    random delay, so searches finish out of order.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockSearchHandler)
+        self.queries = Counter()
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+
+class MockSearchHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)["q"][0]
+        with self.server.lock:
+            self.server.queries[query] += 1
+            delay = self.server.rng.random() / 50
+        time.sleep(delay)
+        if "fail" in query:
+            self.send_response(400)
+            self.end_headers()
+            return
+        docs = []
+        if "hit" in query:
+            docs = [dict(identifier="text%d" % i, title=query) for i in range(2)]
+        body = json.dumps(dict(response=dict(numFound=len(docs), docs=docs))).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = MockSearchServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(search.IAClient, "_session", None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def registration(i, title, disposition="Not renewed."):
+    return dict(
+        uuid="reg%d" % i,
+        title=title,
+        authors=["Someone"],
+        disposition=disposition,
+        reg_dates=[dict(_normalized="1950-0%d-01" % (1 + i % 3))],
+    )
+
+
+REGISTRATIONS = (
+    [registration(i, "hit %d" % i) for i in range(10)]
+    + [registration(i, "miss %d" % i) for i in range(10, 20)]
+    # Two registrations of the same title on the same date.
+    + [registration(20, "hit twice"), registration(23, "hit twice")]
+    + [registration(21, "fail")]
+    + [registration(22, "hit renewed", "Renewed. (Date match.)")]
+)
+
+
+def run(server, tmp_path, workers=4):
+    """Search for REGISTRATIONS the way ia-0-search.py does."""
+    registrations = str(tmp_path / "registrations.ndjson")
+    with codec.Writer(registrations) as out:
+        out.write_all(REGISTRATIONS)
+    output = str(tmp_path / "searches.ndjson")
+    open(output, "w").close()
+
+    session = search.PooledSession(workers, server.base_url)
+    search.IAClient.session(session)
+    adapter = session.get_adapter(server.base_url)
+    cache = search.SearchCache(str(tmp_path / "cache.sqlite"))
+    client = search.IAClient(
+        output, cache=cache, rate_limiter=search.RateLimiter(1000), workers=workers
+    )
+    client.process(registrations)
+    cache.close()
+    # PooledSession keeps its connection pool; Search would have
+    # replaced it.
+    assert session.get_adapter(server.base_url) is adapter
+    return list(codec.read(output))
+
+
+def test_output_keeps_input_order(server, tmp_path):
+    output = run(server, tmp_path)
+    assert [x["uuid"] for x in output] == [
+        x["uuid"] for x in REGISTRATIONS if not x["disposition"].startswith("Renewed")
+    ]
+    assert list(output[0]["ia_search"].values()) == [
+        [dict(identifier="text%d" % i, title=query) for i in range(2)]
+        for query in server.queries
+        if "hit 0" in query
+    ]
+
+
+def test_duplicate_search_is_sent_once(server, tmp_path):
+    run(server, tmp_path)
+    twice = {k: v for k, v in server.queries.items() if "hit twice" in k}
+    # The title alone, and the title with the date range.
+    assert len(twice) == 2
+    assert set(twice.values()) == {1}
+
+
+def test_failed_search_is_not_cached(server, tmp_path):
+    output = run(server, tmp_path)
+    failed = [x for x in output if x["title"] == "fail"][0]
+    assert list(failed["ia_search"].values()) == [[]]
+
+    # Run again with the same cache. Only the failed search is sent.
+    before = Counter(server.queries)
+    (tmp_path / "searches.ndjson").unlink()
+    run(server, tmp_path)
+    sent = server.queries - before
+    assert list(sent) == [q for q in server.queries if "fail" in q]
+
+
+def test_rate_limiter_holds_rate():
+    rate, burst, calls = 100, 10, 60
+    limiter = search.RateLimiter(rate, burst)
+    start = time.monotonic()
+    for _ in range(calls):
+        limiter.wait()
+    elapsed = time.monotonic() - start
+    # The burst goes out at once; every call after it waits its turn.
+    expected = (calls - burst) / rate
+    assert expected * 0.95 <= elapsed < expected + 0.25
+
+
+def test_rate_limiter_is_shared_between_threads():
+    rate, burst, calls = 100, 5, 45
+    limiter = search.RateLimiter(rate, burst)
+    start = time.monotonic()
+    threads = [
+        threading.Thread(target=lambda: [limiter.wait() for _ in range(calls // 5)])
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    expected = (calls - burst) / rate
+    assert expected * 0.95 <= elapsed < expected + 0.25
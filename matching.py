@@ -0,0 +1,802 @@
+# Match unrenewed registrations against catalogs of scanned books.
+#
+# This is the engine behind ia-1-match-registrations.py and
+# hathi-0-match-registrations.py. Each catalog gets a Source, which
+# knows how to read the catalog, which books in it are worth
+# considering, and how its scores are tuned. The normalization,
+# candidate lookup and scoring are shared.
+#
+# To add a catalog, subclass Source, implement candidates(), and set
+# the scoring knobs to taste.
+import datetime
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import Levenshtein as lev
+
+# python-Levenshtein is built on rapidfuzz these days, so this is
+# almost always available. Without it, every title distance is
+# calculated one at a time.
+try:
+    from rapidfuzz import process as rapidfuzz_process
+    from rapidfuzz.distance import Levenshtein as rapidfuzz_lev
+except ImportError:
+    rapidfuzz_process = None
+
+# With pyarrow, the Hathifile is filtered a column at a time.
+try:
+    import pyarrow
+    from pyarrow import compute as pyarrow_compute
+    from pyarrow import csv as pyarrow_csv
+except ImportError:
+    pyarrow_csv = None
+
+import blocking
+import codec
+
+# Ignore CCE entries if they have more than this many matches in the
+# catalog.
+MATCH_CUTOFF = 50
+
+# Only output potential matches if the quality score is above this level.
+QUALITY_CUTOFF = 0
+
+# Stuff published before this year is public domain.
+CUTOFF_YEAR = datetime.datetime.today().year - 95
+
+# The biggest bonuses the year and the author can add to a title
+# score: for the same year, and for exactly the same author. matches()
+# only keeps positive scores, so a candidate whose title score is below
+# zero by more than the bonuses it could still get is not a match, and
+# scoring it can stop there.
+YEAR_BONUS = 0.01
+AUTHOR_BONUS = 0.25
+
+# Leave a little room for rounding when deciding a candidate can't
+# have a positive score.
+ROUNDING = 1e-9
+
+# How many normalized titles and names to remember. The caches are
+# shared by every Matcher in the process. Catalog titles are
+# normalized once, when the catalog is loaded, and kept on the
+# Candidate, so they don't go through the cache at all; what's left is
+# registration titles and author names, which come up over and over.
+CACHE_SIZE = 1024 * 256
+
+NON_ALPHABETIC = re.compile(r"[\W0-9]", re.I + re.UNICODE)
+NON_ALPHANUMERIC = re.compile(r"[\W_]", re.I + re.UNICODE)
+MULTIPLE_SPACES = re.compile(r"\s+")
+
+GENERIC_TITLES = (
+    'annual report',
+    'special report',
+    'proceedings of',
+    'proceedings',
+    'general catalog',
+    'catalog',
+    'report',
+    'questions and answers',
+    'transactions',
+    'yearbook',
+    'year book',
+    'selected poems',
+    'poems',
+    'bulletin',
+    'papers',
+)
+GENERIC_TITLES_RE = re.compile(r"(%s)" % "|".join(GENERIC_TITLES))
+TOTALLY_GENERIC_TITLES_RE = re.compile(r"^(%s)$" % "|".join(GENERIC_TITLES))
+
+
+def stats() -> dict:
+    """How the normalization caches have done so far in this process."""
+    caches = {}
+    for name, function in (
+        ("titles", _normalize),
+        ("names", normalize_name),
+        ("name_words", name_words),
+    ):
+        info = function.cache_info()
+        lookups = info.hits + info.misses
+        caches[name] = dict(
+            hits=info.hits,
+            misses=info.misses,
+            size=info.currsize,
+            maxsize=info.maxsize,
+            hit_rate=info.hits / lookups if lookups else None,
+        )
+    return caches
+
+
+def normalize(text, cache=True) -> str:
+    """Normalize a title for comparison.
+
+    :param cache: Set this to False for a title that will only be
+        normalized once, so it doesn't push anything out of the cache.
+    """
+    if isinstance(text, list):
+        if len(text) == 2:
+            # title + subtitle
+            text = ": ".join(text)
+        else:
+            # book just has variant titles.
+            text = text[0]
+    if cache:
+        return _normalize(text)
+    return _normalize.__wrapped__(text)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize(text) -> str:
+    text = text.lower()
+
+    text = NON_ALPHANUMERIC.sub(" ", text)
+    text = MULTIPLE_SPACES.sub(" ", text)
+
+    # Just ignore these stopwords -- they're commonly missing or
+    # duplicated.
+    for ignorable in (
+            ' the ',
+            ' a ',
+            ' an ',
+    ):
+        text = text.replace(ignorable, '')
+    return text.strip()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_name(name) -> str | None:
+    """Normalize a person's name for comparison."""
+    if not name:
+        return None
+    name = name.lower()
+    name = NON_ALPHABETIC.sub(" ", name)
+    name = MULTIPLE_SPACES.sub(" ", name)
+    return name.strip()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def name_words(name) -> list[str] | None:
+    if not name:
+        return None
+    return sorted(name.split())
+
+
+def generic_title_penalties(title) -> tuple[int, float, int]:
+    """A generic-looking title means that an author match and a close
+    date match is relatively more important.
+
+    :return: A 3-tuple (author penalty multiplier, author base
+        penalty, year penalty multiplier).
+    """
+    title = normalize(title)
+    if "telephone director" in title:
+        # Telephone directories are uniquely awful, and they're
+        # published every year. Hold them to the highest standards.
+        return 7, 1.0, 7
+    if TOTALLY_GENERIC_TITLES_RE.match(title):
+        return 6, 0.8, 5
+    if GENERIC_TITLES_RE.match(title):
+        return 4, 0.7, 4
+    return 1, 0, 1
+
+
+class Candidate:
+    """A book from a catalog that a registration might match."""
+
+    __slots__ = ("title", "authors", "year", "data")
+
+    def __init__(self, title, authors, year, data):
+        # The normalized title.
+        self.title = title
+        # An author or list of authors, or None.
+        self.authors = authors
+        # The publication year, if known.
+        self.year = year
+        # What gets written out if this is a match.
+        self.data = data
+
+
+class Source(ABC):
+    """A catalog of scanned books."""
+
+    # The key the catalog's data is written under in the output.
+    name: str
+
+    # The year penalty grows a little faster than linearly with the
+    # number of years between registration and publication.
+    year_exponent = 1.1
+
+    # An author that doesn't match at all costs no more than this.
+    author_penalty_cap = 0.2
+
+    # The penalty when the registration or the book has no author.
+    missing_author_penalty = 0
+
+    # Whether a perfect match on a short title is worth less.
+    short_title_penalty = False
+
+    def __init__(self, path):
+        self.path = path
+
+    @abstractmethod
+    def candidates(self):
+        """Yield a Candidate for every book in the catalog that's
+        worth matching against.
+        """
+
+    @staticmethod
+    def in_range(year) -> bool:
+        # Don't consider works published more than 5 years out
+        # of the range we're considering. That's plenty of
+        # time to publish the work you registered, or to register
+        # the work you published.
+        return not (year > 1963 + 5 or year < CUTOFF_YEAR)
+
+
+class IASource(Source):
+    """Internet Archive metadata, as written by ia-0-list-texts.py."""
+
+    name = "ia"
+
+    ALREADY_OPEN = {"http://rightsstatements.org/vocab/NKC/1.0/"}
+
+    # Government authors whose work should either be already public
+    # domain or whose work probably wasn't copyrighted, and whose
+    # Internet Archive documents clutter up the matching code.
+    IGNORE_AUTHORS = {"Central Intelligence Agency"}
+
+    def candidates(self):
+        for data in codec.read(self.path):
+            license_url = data.get('licenseurl')
+            if license_url and (
+                    'creativecommons.org' in license_url
+                    or license_url in self.ALREADY_OPEN
+            ):
+                # This is already open-access; don't consider it.
+                continue
+
+            year = data.get('year')
+            if year:
+                year = int(year)
+                if not self.in_range(year):
+                    continue
+            else:
+                year = None
+
+            authors = data.get('creator', [])
+            if not isinstance(authors, list):
+                authors = [authors]
+            if any(author in self.IGNORE_AUTHORS for author in authors):
+                continue
+            title = normalize(data['title'], cache=False)
+            if not title:
+                continue
+            yield Candidate(title, data.get('creator'), year, data)
+
+
+class HathiSource(Source):
+    """An unzipped Hathifile.
+
+    Only a handful of the Hathifile's columns matter, and most of its
+    rows are filtered out, so the rows that are left are normalized and
+    saved to INDEX the first time the file is read. Later runs load
+    the index instead, as long as the Hathifile hasn't changed.
+
+    With pyarrow installed, the Hathifile is read a block at a time
+    and filtered a column at a time, skipping the columns that aren't
+    needed.
+    """
+
+    name = "hathi"
+    year_exponent = 1.15
+    author_penalty_cap = 0.5
+    missing_author_penalty = 0.2
+    short_title_penalty = True
+
+    INDEX = "output/hathi-0-index"
+
+    # Change this when the filtering or normalization changes, so old
+    # indexes get rebuilt.
+    VERSION = 2
+
+    COLUMNS = [
+        "htid", "access", "rights", "ht_bib_key", "description", "source",
+        "source_bib_num", "oclc_num", "isbn", "issn", "lccn", "title",
+        "imprint", "rights_reason_code", "rights_timestamp",
+        "us_gov_doc_flag", "rights_date_used", "pub_place", "lang",
+        "bib_fmt", "collection_code", "content_provider_code",
+        "responsible_entity_code", "digitization_agent_code",
+        "access_profile_code", "author",
+    ]
+
+    # How many bytes of the Hathifile pyarrow reads at a time.
+    BLOCK_SIZE = 1 << 26
+
+    def __init__(self, path, index_path=None):
+        super().__init__(path)
+        self.index_path = index_path or codec.path(self.INDEX)
+
+    def candidates(self):
+        for title, author, year, raw_title, raw_author, identifier in self.index():
+            hathi_dict = dict(
+                title=raw_title, author=raw_author, identifier=identifier,
+                year=year
+            )
+            yield Candidate(title, author, year, hathi_dict)
+
+    def sources(self) -> dict:
+        """Describe the Hathifile, so we can tell if it's changed."""
+        stat = os.stat(self.path)
+        return dict(
+            version=self.VERSION,
+            cutoff_year=CUTOFF_YEAR,
+            source=[self.path, stat.st_size, stat.st_mtime_ns],
+        )
+
+    def index(self):
+        """Yield the rows worth matching against, as lists: normalized
+        title, normalized author, year, title, author, ht_bib_key.
+
+        The rows come from the saved index if it's up to date, and
+        the index is built first if it isn't.
+        """
+        sources = self.sources()
+        if os.path.exists(self.index_path):
+            records = codec.read(self.index_path)
+            if next(records, None) == dict(sources=sources):
+                yield from records
+                return
+            # Close the old index before replacing it.
+            records.close()
+        yield from self.build_index(sources)
+
+    def build_index(self, sources):
+        """Filter and normalize the Hathifile, saving the rows to the
+        index as they're yielded.
+        """
+        # Build into a temporary file, so an interrupted build doesn't
+        # leave a half-finished index behind.
+        base, extension = os.path.splitext(self.index_path)
+        tmp = base + ".tmp" + extension
+        with codec.Writer(tmp) as index:
+            index.write(dict(sources=sources))
+            for title, author, ht_bib_key, year in self.rows():
+                normalized = normalize(title, cache=False)
+                if not normalized:
+                    continue
+                # The author is normalized like a title, which leaves
+                # the digits in -- normalize_name() takes them out
+                # later.
+                row = [
+                    normalized, normalize(author, cache=False), year,
+                    title, author, ht_bib_key
+                ]
+                index.write(row)
+                yield row
+        os.replace(tmp, self.index_path)
+
+    def rows(self):
+        """Yield (title, author, ht_bib_key, year) for every book in
+        the Hathifile that's worth matching against.
+        """
+        if pyarrow_csv is None:
+            return self._python_rows()
+        return self._arrow_rows()
+
+    def _python_rows(self):
+        for raw in open(self.path):
+            row = raw.strip().split("\t")
+            try:
+                htid,access,rights,ht_bib_key,description,source,source_bib_num,oclc_num,isbn,issn,lccn,title,imprint,rights_reason_code,rights_timestamp,us_gov_doc_flag,rights_date_used,pub_place,lang,bib_fmt,collection_code,content_provider_code,responsible_entity_code,digitization_agent_code,access_profile_code,author = row
+            except ValueError:
+                continue
+
+            if bib_fmt != 'BK':
+                # Not a book proper
+                continue
+
+            # Already open access?
+            if us_gov_doc_flag != '0':
+                continue
+            if rights in ['pdus', 'pd']:
+                continue
+
+            # und?
+            if rights not in ['ic', 'und']:
+                continue
+
+            try:
+                year = int(rights_date_used)
+            except ValueError:
+                continue
+            if not self.in_range(year):
+                continue
+            yield title, author, ht_bib_key, year
+
+    def _arrow_rows(self):
+        # The same filters as _python_rows(), a block at a time.
+        pc = pyarrow_compute
+        needed = [
+            "htid", "rights", "ht_bib_key", "title", "us_gov_doc_flag",
+            "rights_date_used", "bib_fmt", "author",
+        ]
+        reader = pyarrow_csv.open_csv(
+            self.path,
+            read_options=pyarrow_csv.ReadOptions(
+                column_names=self.COLUMNS, block_size=self.BLOCK_SIZE
+            ),
+            # Rows without exactly the right number of columns are
+            # skipped.
+            parse_options=pyarrow_csv.ParseOptions(
+                delimiter="\t", quote_char=False,
+                invalid_row_handler=lambda row: "skip",
+            ),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=needed,
+                column_types={x: pyarrow.string() for x in needed},
+            ),
+        )
+        for batch in reader:
+            # Each line used to be stripped before it was split. That
+            # takes the whitespace off the end of the author, and
+            # leaves a row with no author or no htid a column short.
+            author = pc.utf8_rtrim_whitespace(batch.column("author"))
+            keep = pc.and_(
+                pc.and_(
+                    pc.equal(batch.column("bib_fmt"), "BK"),
+                    pc.equal(batch.column("us_gov_doc_flag"), "0"),
+                ),
+                pc.and_(
+                    pc.is_in(
+                        batch.column("rights"),
+                        value_set=pyarrow.array(["ic", "und"]),
+                    ),
+                    pc.and_(
+                        pc.not_equal(author, ""),
+                        pc.not_equal(
+                            pc.utf8_ltrim_whitespace(batch.column("htid")), ""
+                        ),
+                    ),
+                ),
+            )
+            if not pc.any(keep).as_py():
+                continue
+            titles = pc.filter(batch.column("title"), keep)
+            authors = pc.filter(author, keep)
+            keys = pc.filter(batch.column("ht_bib_key"), keep)
+            years = pc.filter(batch.column("rights_date_used"), keep)
+            if not pc.all(pc.match_substring_regex(years, r"^[0-9]{1,9}$")).as_py():
+                # Some years need int() to read them -- " 1950",
+                # "+1950", "1_950" -- or aren't years at all.
+                for row in zip(
+                    titles.to_pylist(), authors.to_pylist(),
+                    keys.to_pylist(), years.to_pylist(),
+                ):
+                    try:
+                        year = int(row[3])
+                    except ValueError:
+                        continue
+                    if self.in_range(year):
+                        yield row[:3] + (year,)
+                continue
+            years = pc.cast(years, pyarrow.int64())
+            in_range = pc.and_(
+                pc.greater_equal(years, CUTOFF_YEAR),
+                pc.less_equal(years, 1963 + 5),
+            )
+            yield from zip(
+                pc.filter(titles, in_range).to_pylist(),
+                pc.filter(authors, in_range).to_pylist(),
+                pc.filter(keys, in_range).to_pylist(),
+                pc.filter(years, in_range).to_pylist(),
+            )
+
+
+class Matcher:
+    def __init__(self, source, strategies=None):
+        self.source = source
+        # Candidates are found by the two longest words of the title,
+        # unless other blocking strategies are asked for.
+        self.blocker = blocking.Blocker(strategies)
+        for candidate in source.candidates():
+            self.blocker.add(candidate, candidate.title)
+
+    def matches(self, registration):
+        """Yield (registration, candidate, quality) for every candidate
+        with a positive quality score.
+        """
+        if not registration.title:
+            return
+        registration_title = normalize(registration.title)
+        candidates = self.blocker.candidates(registration_title)
+        if not candidates:
+            return
+        qualities = self.evaluate_matches(candidates, registration, registration_title)
+        for candidate, quality in zip(candidates, qualities):
+            if quality is not None and quality > 0:
+                yield registration, candidate, quality
+
+    def scored_matches(self, registration):
+        """Yield (registration, candidate, quality) for every match
+        good enough to output, with the quality adjusted for the number
+        of matches.
+        """
+        title = registration.title
+        if not title or not normalize(title):
+            return
+        matches = list(self.matches(registration))
+
+        # If there are a huge number of matches for a CCE title,
+        # penalize them -- it's probably a big mess that must be dealt
+        # with separately. Give a slight boost if there's only a single
+        # match.
+        if len(matches) == 1:
+            num_matches_coefficient = 1.1
+        elif len(matches) <= MATCH_CUTOFF:
+            num_matches_coefficient = 1
+        else:
+            num_matches_coefficient = 1 - (
+                    len(matches) - MATCH_CUTOFF / float(MATCH_CUTOFF)
+            )
+        for registration, candidate, quality in matches:
+            quality *= num_matches_coefficient
+            if quality <= QUALITY_CUTOFF:
+                continue
+            yield registration, candidate, quality
+
+    def title_distances(self, registration_title, candidates, max_bonus) -> list:
+        """Find the edit distance between a registration's title and
+        the title of each candidate, all at once.
+
+        :param max_bonus: The most the year and author could add to a
+            candidate's score.
+        :return: A list with the distance for each candidate, False
+            for a candidate whose title is too different for it to be
+            a match, or None if the distance wasn't calculated.
+        """
+        # evaluate_titles normalizes the title again, and the distance
+        # is to that.
+        target = normalize(registration_title)
+        if rapidfuzz_process is None or not target:
+            return [None] * len(candidates)
+        titles = [candidate.title for candidate in candidates]
+
+        # A title score is 1 - 1.5 * (distance / length of the longer
+        # title), so anything further away than this can't be a match
+        # with any of the candidates, and rapidfuzz can give up on it
+        # early.
+        longest = max(len(target), max(map(len, titles)))
+        cutoff = int(longest * (1 + max_bonus) / 1.5) + 1
+
+        distances = [False] * len(candidates)
+        for title, distance, i in rapidfuzz_process.extract(
+            target, titles, scorer=rapidfuzz_lev.distance,
+            score_cutoff=cutoff, limit=None,
+        ):
+            distances[i] = distance
+        return distances
+
+    def evaluate_match(self, candidate, registration, registration_title):
+        return self.evaluate_matches(
+            [candidate], registration, registration_title, prune=False
+        )[0]
+
+    def evaluate_matches(
+        self, candidates, registration, registration_title, prune=True
+    ) -> list[float | None]:
+        """Score a registration against a list of candidates.
+
+        :param prune: Stop scoring a candidate as soon as it's clear
+            its score can't be positive.
+        :return: The quality of each candidate, or None for a candidate
+            that was pruned.
+        """
+        registration_date = registration.best_guess_registration_date
+        registration_authors = registration.authors or []
+        # A generic-looking title has a correspondingly greater emphasis on
+        # an author match and a close year match.
+        penalties = generic_title_penalties(registration_title)
+        author_bonus = AUTHOR_BONUS if registration_authors else 0
+        if prune:
+            year_bonus = YEAR_BONUS if registration_date else 0
+            distances = self.title_distances(
+                registration_title, candidates, year_bonus + author_bonus
+            )
+        else:
+            distances = [None] * len(candidates)
+
+        # The candidates in a bucket often share a title, a year or an
+        # author, so each one is only scored once.
+        title_qualities = {}
+        date_penalties = {}
+        author_penalties = {}
+        qualities = []
+        for candidate, distance in zip(candidates, distances):
+            if distance is False:
+                qualities.append(None)
+                continue
+
+            # The basic quality evaluation is based on title similarity.
+            title_quality = title_qualities.get(candidate.title)
+            if title_quality is None:
+                title_quality = title_qualities[candidate.title] = self.evaluate_titles(
+                    candidate.title, registration_title, registration.title,
+                    distance
+                )
+
+            year = candidate.year
+            if year not in date_penalties:
+                date_penalties[year] = self.date_penalty(year, registration_date)
+            date_penalty = date_penalties[year]
+
+            if prune:
+                if date_penalty > 0:
+                    date_penalty *= penalties[2]
+                if title_quality - date_penalty + author_bonus < -ROUNDING:
+                    # Even a perfect author match won't save it.
+                    qualities.append(None)
+                    continue
+
+            authors = candidate.authors
+            key = tuple(authors) if isinstance(authors, list) else authors
+            if key not in author_penalties:
+                author_penalties[key] = self.author_penalty(
+                    authors, registration_authors
+                )
+
+            qualities.append(
+                self.quality(
+                    title_quality, date_penalties[year], author_penalties[key],
+                    penalties
+                )
+            )
+        return qualities
+
+    def date_penalty(self, year, registration_date):
+        # A penalty is applied if the publication date is far away from the
+        # copyright registration date.
+        #
+        # Assume we don't know the registration date; there will be no penalty.
+        if registration_date and year is not None:
+            return self.evaluate_years(year, registration_date.year)
+        return 0
+
+    def author_penalty(self, authors, registration_authors):
+        # A penalty is applied if the authors are clearly divergent,
+        # but it's quite common so we don't usually make a big deal of it.
+        if registration_authors and authors:
+            return self.evaluate_authors(authors, registration_authors)
+        # Author data is missing.
+        return self.source.missing_author_penalty
+
+    @staticmethod
+    def quality(title_quality, date_penalty, author_penalty, penalties):
+        author_penalty_multiplier, author_base_penalty, year_penalty_multiplier = penalties
+        if author_penalty == 0:
+            author_penalty = author_base_penalty
+        elif author_penalty > 0:
+            author_penalty *= author_penalty_multiplier
+        if date_penalty > 0:
+            date_penalty *= year_penalty_multiplier
+
+        return title_quality - date_penalty - author_penalty
+
+    def evaluate_titles(self, candidate, registration, raw_title, distance=None):
+        """Score the similarity of two titles.
+
+        :param candidate: The normalized title from the catalog.
+        :param registration: The registration's title.
+        :param raw_title: The registration's title as it was
+            registered. The bonus for a perfect match is based on this.
+        :param distance: The edit distance between the titles, if it's
+            already known.
+        """
+        normalized_registration = normalize(registration)
+        if not normalized_registration:
+            return -1
+        if candidate == normalized_registration:
+            # The titles are a perfect match. Give a bonus -- unless
+            # the title is also short or generic. That's not very
+            # impressive.
+            a, b, c = generic_title_penalties(raw_title)
+            length_multiplier = 1
+            if self.source.short_title_penalty and len(raw_title) < 15:
+                # A title with a subtitle is a 2-item list, so it
+                # counts as very short.
+                length_multiplier = 1 - ((15 - len(raw_title)) * 0.05)
+            if a == 1:
+                # Not generic.
+                return 1.2 * length_multiplier
+            else:
+                # Generic.
+                return 1 * length_multiplier
+
+        # Calculate the Levenshtein distance between the two strings,
+        # as a proportion of the length of the longer string.
+        #
+        # This ~ the quality of the title match.
+
+        # If you have to change half of the characters to get from one
+        # string to another, that's a score of 50%, which isn't
+        # "okay", it's really bad.  Multiply the distance by a
+        # constant to reflect this.
+        if distance is None:
+            distance = lev.distance(candidate, normalized_registration)
+        distance *= 1.5
+        longer_string = max(len(candidate), len(normalized_registration))
+        proportional_changes = distance / float(longer_string)
+
+        proportional_distance = 1 - (proportional_changes)
+        return proportional_distance
+
+    def evaluate_years(self, candidate, registration):
+        if candidate == registration:
+            # Exact match gets a slight negative penalty -- a bonus.
+            return -0.01
+        # Apply a penalty for every year of difference between the
+        # registration year and the publication year according to the
+        # catalog. The penalty has a slight exponential element -- 5
+        # years in either direction really should be enough for a match.
+        return (abs(candidate - registration) ** self.source.year_exponent) * 0.1
+
+    def evaluate_authors(self, candidate_authors, registration_authors):
+        if not candidate_authors or not registration_authors:
+            # We don't have the information necessary to match up
+            # authors. No penalty (though if the title is generic, a
+            # base penalty will be applied.)
+            return 0
+
+        # Return the smallest penalty for the given list of authors.
+        if not isinstance(candidate_authors, list):
+            candidate_authors = [candidate_authors]
+        if not isinstance(registration_authors, list):
+            registration_authors = [registration_authors]
+
+        penalties = []
+        for ca in candidate_authors:
+            for ra in registration_authors:
+                penalty = self.evaluate_author(ca, ra)
+                if penalty is not None:
+                    penalties.append(penalty)
+        if not penalties:
+            # We couldn't figure it out. No penalty.
+            return 0
+
+        # This will find the largest negative penalty (bonus) or the
+        # smallest positive penalty.
+        return min(penalties)
+
+    def evaluate_author(self, candidate_author, registration_author):
+        # Determine the size of the rating penalty due to the mismatch
+        # between these two authors.
+        candidate_author = normalize_name(candidate_author)
+        registration_author = normalize_name(registration_author)
+
+        if not candidate_author or not registration_author:
+            # We just don't know.
+            return None
+
+        if candidate_author == registration_author:
+            # Exact match gets a negative penalty -- a bonus.
+            return -0.25
+
+        candidate_words = name_words(candidate_author)
+        registration_words = name_words(registration_author)
+        if candidate_words == registration_words:
+            # These are probably the same author. Return a negative
+            # penalty -- a bonus.
+            return -0.2
+
+        distance = lev.distance(candidate_author, registration_author)
+        longer_string = max(len(candidate_author), len(registration_author))
+        proportional_changes = distance / float(longer_string)
+        penalty = 1 - proportional_changes
+
+        if penalty > 0:
+            # Beyond "a couple typoes", the Levenshtein distance
+            # basically means there's no match, so we cap the penalty.
+            penalty = min(penalty, self.source.author_penalty_cap)
+        return penalty
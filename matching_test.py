@@ -0,0 +1,92 @@
+import pytest
+
+from matching import CUTOFF_YEAR, HathiSource
+
+pytest.importorskip("pyarrow.csv")
+
+
+def hathi_row(htid="mdp.1", rights="ic", year=str(CUTOFF_YEAR + 10),
+              title="A title", author="Someone, A.", bib_fmt="BK",
+              us_gov_doc_flag="0", ht_bib_key="001") -> list[str]:
+    row = dict.fromkeys(HathiSource.COLUMNS, "x")
+    row.update(
+        htid=htid, rights=rights, rights_date_used=year, title=title,
+        author=author, bib_fmt=bib_fmt, us_gov_doc_flag=us_gov_doc_flag,
+        ht_bib_key=ht_bib_key,
+    )
+    return [row[x] for x in HathiSource.COLUMNS]
+
+
+ROWS = [
+    hathi_row(),
+    hathi_row(rights="und"),
+    hathi_row(title="Trailing space after the author", author="Someone  "),
+    # Not matched against.
+    hathi_row(rights="pdus"),
+    hathi_row(rights="pd"),
+    hathi_row(bib_fmt="SE"),
+    hathi_row(us_gov_doc_flag="1"),
+    # Out of range, or not a year.
+    hathi_row(year="9999"),
+    hathi_row(year=str(CUTOFF_YEAR - 1)),
+    hathi_row(year="1969"),
+    hathi_row(year="1968"),
+    hathi_row(year=str(CUTOFF_YEAR)),
+    hathi_row(year=""),
+    hathi_row(year="19xx"),
+    # int() takes all of these.
+    hathi_row(year=" 1950"),
+    hathi_row(year="1950 "),
+    hathi_row(year="+1950"),
+    hathi_row(year="1_950"),
+    hathi_row(year="00001950"),
+    # A blank author, once the line is stripped, leaves the row a
+    # column short.
+    hathi_row(author=""),
+    hathi_row(author="   "),
+    # So does a blank htid.
+    hathi_row(htid=""),
+    hathi_row(htid="  "),
+    hathi_row(htid="  mdp.2"),
+]
+
+
+@pytest.fixture
+def hathifile(tmp_path):
+    lines = ["\t".join(row) for row in ROWS]
+    # One column short, and one too many.
+    lines.append("\t".join(hathi_row()[:-1]))
+    lines.append("\t".join(hathi_row() + ["extra"]))
+    lines.append("")
+    path = tmp_path / "hathifile.tsv"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_arrow_rows_match_python_rows(hathifile):
+    source = HathiSource(hathifile)
+    python_rows = list(source._python_rows())
+    assert len(python_rows) == 11
+    assert list(source._arrow_rows()) == python_rows
+
+
+def test_arrow_rows_in_small_blocks(hathifile, monkeypatch):
+    # Each block is filtered on its own; rows that need int() to read
+    # their year must keep their place.
+    monkeypatch.setattr(HathiSource, "BLOCK_SIZE", 1024)
+    source = HathiSource(hathifile)
+    assert list(source._arrow_rows()) == list(source._python_rows())
+
+
+def test_index_is_rebuilt_when_stale(hathifile, tmp_path):
+    index_path = str(tmp_path / "index.ndjson")
+    source = HathiSource(hathifile, index_path)
+    built = list(source.index())
+    assert list(source.index()) == built
+
+    with open(index_path) as f:
+        lines = f.readlines()
+    lines[0] = '{"sources": "an older Hathifile"}\n'
+    with open(index_path, "w") as f:
+        f.writelines(lines[:3])
+    assert list(source.index()) == built
@@ -0,0 +1,425 @@
+# Measure where each stage of the pipeline spends its time.
+#
+# A script creates a Metrics at the start of its run and calls
+# finish() at the end. In between, the work is timed in named phases
+# -- parse, match, classify, serialize -- and the records handled are
+# counted:
+#
+#     run = metrics.Metrics()
+#     for data in run.timed("parse", codec.read(path)):
+#         with metrics.phase("classify"):
+#             ...
+#         run.count()
+#     run.finish()
+#
+# finish() prints a one-line summary and writes a JSON report to
+# output/metrics/<stage>.json. The report covers records per second,
+# the time spent in each phase, peak memory use and the hit rates of
+# any caches the script registered. It's also appended to
+# output/metrics/history.ndjson, so runs can be compared over time.
+# Set CCE_METRICS to use a different directory.
+#
+# Set CCE_PROFILE to profile the run as well:
+#
+# * cprofile: run under cProfile. The stats go to <stage>.prof, for
+#   pstats or snakeviz, and the top functions go in the report.
+# * sample: look at the stack a hundred times a second and count
+#   what's running. This costs next to nothing. The stacks go to
+#   <stage>.folded, which flamegraph.pl can draw, and the top
+#   functions go in the report.
+#
+# Only the main process is profiled, unless the work is handed to the
+# workers through measure(), which profiles it there and sends the
+# results back to be added to the main process's profile. Otherwise,
+# time that worker processes spend shows up as time the main process
+# spends waiting for them.
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows.
+    resource = None
+
+import codec
+
+DIRECTORY = os.environ.get("CCE_METRICS", "output/metrics")
+PROFILERS = ("cprofile", "sample")
+PROFILE = os.environ.get("CCE_PROFILE") or None
+if PROFILE not in PROFILERS + (None,):
+    raise ValueError(
+        "Unknown CCE_PROFILE %r; use one of %s" % (PROFILE, ", ".join(PROFILERS))
+    )
+
+# How often the sampling profiler looks at the stack, in seconds.
+SAMPLE_INTERVAL = 0.01
+
+# How many functions from a profile go in the report.
+TOP_FUNCTIONS = 25
+
+# The Metrics for this process's run, if there is one.
+current = None
+
+
+class Phase:
+    """A stopwatch for one kind of work. Use it as a context manager
+    around each piece of the work; the time adds up.
+    """
+
+    __slots__ = ("name", "seconds", "calls", "started")
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds += time.perf_counter() - self.started
+        self.calls += 1
+
+
+class Sampler(threading.Thread):
+    """A sampling profiler for the thread that creates it."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.target = threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                stack.append(self.describe(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    @staticmethod
+    def describe(code) -> str:
+        return "%s:%d(%s)" % (
+            os.path.basename(code.co_filename), code.co_firstlineno, code.co_name
+        )
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        """Write the stacks in the 'folded' format flame graph tools
+        read.
+        """
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("%s %d\n" % (stack, count))
+
+    def top(self, n=TOP_FUNCTIONS) -> list[dict]:
+        """The functions that were running in the most samples."""
+        total = sum(self.stacks.values())
+        own = Counter()
+        anywhere = Counter()
+        for stack, count in self.stacks.items():
+            functions = stack.split(";")
+            own[functions[-1]] += count
+            for function in set(functions):
+                anywhere[function] += count
+        return [
+            dict(
+                function=function,
+                own=count / total,
+                cumulative=anywhere[function] / total,
+            )
+            for function, count in own.most_common(n)
+        ]
+
+
+class _Profiled:
+    """cProfile stats sent back from another process, in a form
+    pstats can load.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def top_functions(stats: pstats.Stats, n=TOP_FUNCTIONS) -> list[dict]:
+    """The functions a cProfile profile spent the most time in,
+    counting the functions they called.
+    """
+    top = sorted(stats.stats.items(), key=lambda x: x[1][3], reverse=True)[:n]
+    return [
+        dict(
+            function="%s:%d(%s)" % (os.path.basename(filename), line, name),
+            calls=calls,
+            own=own,
+            cumulative=cumulative,
+        )
+        for (filename, line, name), (_, calls, own, cumulative, _) in top
+    ]
+
+
+def peak_rss() -> dict | None:
+    """The most memory this process, and the biggest of its finished
+    child processes, have used at once, in MiB.
+    """
+    if resource is None:
+        return None
+    # Linux measures this in KiB, macOS in bytes. Linux also carries
+    # the peak over when a process runs a new program, so a script
+    # started by pipeline.py reports at least the pipeline's own peak.
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return dict(
+        self=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    )
+
+
+def phase(name) -> Phase:
+    """The Phase with this name in the current run.
+
+    Outside a run -- in a worker process, or a script that isn't
+    measured -- this is a stopwatch nobody looks at.
+    """
+    if current is None:
+        return Phase(name)
+    return current.phase(name)
+
+
+def timed(name, iterable):
+    """Time the iteration as part of a phase of the current run, if
+    there is one.
+    """
+    if current is None:
+        return iterable
+    return current.timed(name, iterable)
+
+
+def count(records=1):
+    """Count records handled in the current run, if there is one."""
+    if current is not None:
+        current.records += records
+
+
+def _after_fork():
+    # A forked worker has its own copy of the run, which would never
+    # be reported, and shouldn't be profiled.
+    global current
+    while current is not None:
+        if current.profiler is not None:
+            current.profiler.disable()
+        current = current.previous
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def measure(function, *args, profile=PROFILE):
+    """Call function(*args) in a worker process, timing and profiling
+    it the way the main process's run is.
+
+    :return: A 2-tuple (what the function returned, stats). Hand the
+        stats to Metrics.add() in the main process.
+    """
+    profiler = sampler = None
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == "sample":
+        sampler = Sampler()
+        sampler.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+    stats = dict(seconds=seconds, profile=None)
+    if profiler:
+        profiler.create_stats()
+        stats["profile"] = profiler.stats
+    elif sampler:
+        stats["profile"] = sampler.stacks
+    return result, stats
+
+
+class Metrics:
+    """The measurements for one run of a script."""
+
+    def __init__(self, stage=None, directory=DIRECTORY, profile=PROFILE):
+        """Start measuring.
+
+        :param stage: The name of the stage. Defaults to the name of
+            the script being run.
+        """
+        global current
+        self.stage = stage or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        self.directory = directory
+        self.phases = {}
+        self.records = 0
+        # Functions that return the stats of each cache, and anything
+        # else worth reporting, called when the run is finished.
+        self.caches = {}
+        self.extra = {}
+        # Time spent in worker processes, as sent back by measure().
+        self.worker_seconds = 0.0
+        self.worker_profiles = []
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.start = time.perf_counter()
+        # A run started inside another one -- a stage run by
+        # pipeline.py -- hands back to it when it's finished.
+        self.previous = current
+        current = self
+
+        self.profile = profile
+        self.profiler = self.sampler = None
+        if profile == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif profile == "sample":
+            self.sampler = Sampler()
+            self.sampler.start()
+
+    def phase(self, name) -> Phase:
+        if name not in self.phases:
+            self.phases[name] = Phase(name)
+        return self.phases[name]
+
+    def timed(self, name, iterable):
+        """Iterate over `iterable`, counting the time it takes to come
+        up with each item as part of a phase.
+        """
+        phase = self.phase(name)
+        iterator = iter(iterable)
+        while True:
+            with phase:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, records=1):
+        self.records += records
+
+    def add(self, stats):
+        """Add the stats measure() sent back from a worker process."""
+        self.worker_seconds += stats["seconds"]
+        if stats["profile"] is not None:
+            self.worker_profiles.append(stats["profile"])
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        measured = sum(x.seconds for x in self.phases.values())
+        phases = {
+            name: dict(seconds=x.seconds, share=x.seconds / elapsed if elapsed else 0)
+            for name, x in self.phases.items()
+        }
+        phases["other"] = dict(
+            seconds=elapsed - measured,
+            share=(elapsed - measured) / elapsed if elapsed else 0,
+        )
+        report = dict(
+            stage=self.stage,
+            started=self.started,
+            arguments=sys.argv[1:],
+            format=codec.FORMAT,
+            json=codec.JSON_BACKEND,
+            seconds=elapsed,
+            records=self.records,
+            records_per_second=self.records / elapsed if elapsed else None,
+            phases=phases,
+            peak_rss_mb=peak_rss(),
+            caches={
+                name: stats() if callable(stats) else stats
+                for name, stats in self.caches.items()
+            },
+        )
+        if self.worker_seconds:
+            # This can add up to more than `seconds`, since the
+            # workers run side by side.
+            report["worker_seconds"] = self.worker_seconds
+        for name, stats in self.extra.items():
+            report[name] = stats() if callable(stats) else stats
+        return report
+
+    def finish(self) -> dict:
+        """Stop measuring, and write out the report."""
+        global current
+        if self.profiler:
+            self.profiler.disable()
+        if self.sampler:
+            self.sampler.stop()
+        report = self.report()
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, self.stage)
+        if self.profiler:
+            stats = pstats.Stats(self.profiler)
+            for profile in self.worker_profiles:
+                stats.add(_Profiled(profile))
+            stats.dump_stats(base + ".prof")
+            report["profile"] = dict(
+                profiler=self.profile,
+                output=base + ".prof",
+                top=top_functions(stats),
+            )
+        if self.sampler:
+            for stacks in self.worker_profiles:
+                self.sampler.stacks.update(stacks)
+            self.sampler.write(base + ".folded")
+            report["profile"] = dict(
+                profiler=self.profile,
+                output=base + ".folded",
+                samples=sum(self.sampler.stacks.values()),
+                top=self.sampler.top(),
+            )
+        with open(base + ".json", "w") as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(self.directory, "history.ndjson"), "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+        print(self.summary(report), file=sys.stderr)
+        if current is self:
+            current = self.previous
+        return report
+
+    @staticmethod
+    def summary(report) -> str:
+        """Describe a report in one line."""
+        phases = ", ".join(
+            "%s %d%%" % (name, round(x["share"] * 100))
+            for name, x in report["phases"].items()
+        )
+        line = "%s: %d records in %.1fs (%d/s); %s" % (
+            report["stage"],
+            report["records"],
+            report["seconds"],
+            report["records_per_second"] or 0,
+            phases,
+        )
+        if report["peak_rss_mb"]:
+            line += "; peak RSS %d MB" % report["peak_rss_mb"]["self"]
+        return line
@@ -3,16 +3,21 @@ from __future__ import annotations
 import datetime
 import json
 import re
+from collections import defaultdict
 from typing import Iterable
 
-import dateutil
+import dateutil.parser
 import regex
-from dateutil import parser as date_parser
+
+import codec
+import dates
 
 
 class XMLParser:
     """Helper methods for running XPath queries."""
 
+    __slots__ = ()
+
     @classmethod
     def xpath(cls, tag, path) -> list[str | None]:
         """Find all child tags matching `path` and return a list of all
@@ -31,6 +36,24 @@ class XMLParser:
             return None
         return results[0].text
 
+    @classmethod
+    def child_tags_by_name(cls, tag) -> dict[str, list]:
+        """Group the child tags of `tag` by tag name, in document order.
+
+        Walking the children once and looking them up by name is a lot
+        cheaper than running a separate XPath query for every kind of
+        child tag.
+        """
+        children = defaultdict(list)
+        for child in tag:
+            children[child.tag].append(child)
+        return children
+
+    @classmethod
+    def texts(cls, tags) -> list[str]:
+        """Return all non-empty text nodes within `tags`."""
+        return [x.text for x in tags if x.text]
+
     @classmethod
     def _package(cls, tag) -> dict:
         """Package a tag as a dictionary.
@@ -42,6 +65,18 @@ class XMLParser:
         attrib["_text"] = tag.text
         return attrib
 
+    @classmethod
+    def dates(cls, date_tags, warnings=None) -> list[dict]:
+        """Turn a list of tags containing date information into
+        dictionaries. Equivalent to date() with allow_multiple=True.
+        """
+        dates = []
+        for date_tag in date_tags:
+            processed = cls._parse_date_tag(date_tag, warnings)
+            if processed:
+                dates.append(processed)
+        return dates
+
     @classmethod
     def date(cls, tag, path, allow_multiple=False, warnings=None):
         results = tag.xpath(path)
@@ -50,11 +85,7 @@ class XMLParser:
                 return []
             else:
                 return None
-        dates = []
-        for date_tag in results:
-            processed = cls._parse_date_tag(date_tag, warnings)
-            if processed:
-                dates.append(processed)
+        dates = cls.dates(results, warnings)
         if allow_multiple:
             return dates
 
@@ -74,37 +105,22 @@ class XMLParser:
         data = cls._package(date_tag)
         raw = data.get("date") or date_tag.text
         data["_text"] = raw
+        if raw:
+            # Parse the date now, so later stages don't have to. They
+            # still add the warning if it couldn't be parsed.
+            try:
+                parsed = cls._parse_date(raw)
+            except OverflowError:
+                return data
+            if parsed:
+                data["_normalized"] = parsed.isoformat()[:10]
+            else:
+                data["_error"] = "Could not parse date."
         return data
 
     @classmethod
     def _parse_date(cls, raw, warnings=None) -> datetime.datetime | None:
-        parsed = None
-        # Try to parse the full date, and parse just the year and
-        # month if that fails. In most cases that's all we really
-        # need.
-        attempts = [raw]
-        if len(raw) > 7 and raw[7] == "-":
-            attempts.append(raw[:7])
-        for attempt in attempts:
-            try:
-                parsed = date_parser.parse(attempt)
-                if not parsed:
-                    continue
-                if parsed.year > 2000 and len(raw) in (6, 7):
-                    # A very common date format is '19Jun58',
-                    # which date_parser parses as 2059. Subtract
-                    # 100 years and we're in business.
-                    parsed = datetime.datetime(
-                        parsed.year - 100, parsed.month, parsed.day
-                    )
-                if parsed.year > 1995 or parsed.year < 1900:
-                    # This is most likely a totally incorrect date, or
-                    # not a date at all.
-                    parsed = None
-                else:
-                    break
-            except ValueError:
-                continue
+        parsed = dates.parse(raw)
         if not parsed and warnings is not None:
             msg = "Could not parse date %s" % raw
             warnings.append(msg)
@@ -147,13 +163,12 @@ class Publisher(XMLParser):
     def from_tag(cls, publisher, warnings=None) -> "Publisher":
         """Parse publisher information from a <publisher> tag."""
         extra = dict(publisher.attrib)
-        pub_dates = cls.date(
-            publisher, "pubDate", allow_multiple=True, warnings=warnings
-        )
-        places = cls.xpath(publisher, "pubPlace")
+        children = cls.child_tags_by_name(publisher)
+        pub_dates = cls.dates(children["pubDate"], warnings=warnings)
+        places = cls.texts(children["pubPlace"])
         claimants: list[str] = []
         nonclaimants: list[str] = []
-        for publisher_name_tag in publisher.xpath("pubName"):
+        for publisher_name_tag in children["pubName"]:
             name = publisher_name_tag.text
             is_claimant = publisher_name_tag.attrib.get("claimant")
             if is_claimant == "yes":
@@ -190,40 +205,102 @@ class Places:
     # Big foreign publishing cities that are sometimes mentioned
     # without the context of the country.
     FOREIGN_CITIES = {"Paris", "London", "Berlin"}
+    FOREIGN_CITY = re.compile("|".join(sorted(FOREIGN_CITIES)))
 
-    def __init__(self):
+    def __init__(self, path="countries.json"):
         self.foreign_countries = set()
-        self.foreign_country_endings = set()
-        for i in json.load(open("countries.json"))["countries"]:
+        with open(path) as countries:
+            names = json.load(countries)["countries"]
+        for i in names:
             if i not in ("United States Of America", "Georgia"):
                 self.foreign_countries.add(i)
-                self.foreign_country_endings.add(", " + i)
         for name in ("England", "Scotland", "Eng.", "U.K.", "UK"):
             self.foreign_countries.add(name)
-            self.foreign_country_endings.add(", " + name)
 
     def is_foreign(self, place) -> bool:
         """Make a best guess as to whether a place name is in
         another country.
         """
         if place.endswith("."):
-            place = place[:1]
+            # This was meant to strip the period, but it has always
+            # cut the place down to its first letter (place[:1]), and
+            # no one-letter place is foreign. So a place that ends with
+            # a period, like "London, Eng.", is never considered
+            # foreign. The outputs depend on that, so it stays.
+            return False
         if place in self.FOREIGN_CITIES:
             return True
         if place in self.foreign_countries:
             return True
-        if "," in place and any(x in place for x in self.FOREIGN_CITIES):
+        if "," in place and self.FOREIGN_CITY.search(place):
             # This will incorrectly flag "London, Ontario" but it will
             # correctly flag "London, New York", which is more common.
             return True
-        if any(place.endswith(x) for x in self.foreign_country_endings):
-            return True
-        return False
+        # No country name has ", " in it, so a place ends with ", "
+        # and a foreign country exactly when whatever follows its last
+        # ", " is a foreign country. That's one set lookup instead of
+        # a couple hundred endswith() calls.
+        rest, comma, country = place.rpartition(", ")
+        return bool(comma) and country in self.foreign_countries
+
+    def foreign_places(self, places) -> list[bool]:
+        """Run is_foreign over a column of places, checking each
+        distinct place once.
+        """
+        verdicts = {place: self.is_foreign(place) for place in set(places)}
+        return [verdicts[place] for place in places]
 
 
 class Registration(XMLParser):
     PLACES = Places()
 
+    # Stage 2 and the IA/Hathi scripts create millions of these, so
+    # don't give each one a __dict__.
+    __slots__ = (
+        "uuid",
+        "regnums",
+        "reg_dates",
+        "title",
+        "authors",
+        "notes",
+        "new_matter_claimed",
+        "publishers",
+        "previous_regnums",
+        "previous_publications",
+        "extra",
+        "parent",
+        "children",
+        "xrefs",
+        "warnings",
+        "error",
+        "disposition",
+        "renewals",
+        "group_title",
+        "group_uuid",
+        "year",
+        # Cached results of is_foreign and previously_published.
+        "_foreign",
+        "_previously_published",
+    )
+
+    # Child tags that from_tag() stores in `extra`.
+    EXTRA_TAGS = (
+        "edition",
+        "noticedate",
+        "series",
+        "vol",
+        "desc",
+        "pubDate",
+        "volumes",
+        "claimant",
+        "copies",
+        "affDate",
+        "lccn",
+        "copyDate",
+        "role",
+        "page",
+    )
+
     def __init__(
         self,
         uuid: str | None = None,
@@ -270,6 +347,8 @@ class Registration(XMLParser):
         self.group_title = group_title
         self.group_uuid = group_uuid
         self.year = year
+        self._foreign = None
+        self._previously_published = None
 
     def jsonable(
         self, include_others=True, compact=True, require_disposition=False
@@ -351,6 +430,12 @@ class Registration(XMLParser):
     def from_json(cls, data) -> "Registration":
         return cls(**data)
 
+    @classmethod
+    def load(cls, path) -> Iterable["Registration"]:
+        """Load Registrations from a file written by one of the stages."""
+        for data in codec.read(path):
+            yield cls.from_json(data)
+
     @classmethod
     def from_tag(
         cls, tag, parent=None, include_extra=True, group_uuid=None
@@ -391,53 +476,34 @@ class Registration(XMLParser):
         uuid = tag.attrib.get("id", None)
         warnings: list[str] = []
         regnums = tag.attrib.get("regnum", "").split()
-        reg_dates = cls.date(
-            tag,
-            "regDate",
-            allow_multiple=True,
-            warnings=warnings,
-        ) + cls.date(
-            tag,
-            "regdate",
-            allow_multiple=True,
-            warnings=warnings,
+        child_tags = cls.child_tags_by_name(tag)
+        reg_dates = cls.dates(child_tags["regDate"], warnings=warnings) + cls.dates(
+            child_tags["regdate"], warnings=warnings
         )
-        title = cls.xpath1(tag, "title")
-        authors += cls.xpath(tag, "author/authorName")
-        notes = cls.xpath(tag, "note")
+        titles = child_tags["title"]
+        title = titles[0].text if titles else None
+        authors += cls.texts(
+            name
+            for author in child_tags["author"]
+            for name in author
+            if name.tag == "authorName"
+        )
+        notes = cls.texts(child_tags["note"])
         publishers += [
             Publisher.from_tag(publisher_tag, warnings)
-            for publisher_tag in tag.xpath("publisher")
+            for publisher_tag in child_tags["publisher"]
         ]
-        previous_regnums = cls.xpath(tag, "prev-regNum")
-        previous_publications = cls.xpath(tag, "prevPub")
+        previous_regnums = cls.texts(child_tags["prev-regNum"])
+        previous_publications = cls.texts(child_tags["prevPub"])
 
-        new_matter_claimed = cls.xpath(tag, "newMatterClaimed")
+        new_matter_claimed = cls.texts(child_tags["newMatterClaimed"])
 
         # We'll parse out these items and store the data, but they're
         # not currently important to the clearance process.
         extra = {}
         if include_extra:
-            for name in [
-                "edition",
-                "noticedate",
-                "series",
-                "vol",
-                "desc",
-                "pubDate",
-                "volumes",
-                "claimant",
-                "copies",
-                "affDate",
-                "lccn",
-                "copyDate",
-                "role",
-                "page",
-                "copyDate",
-            ]:
-                tags = []
-                for extra_tag in tag.xpath(name):
-                    tags.append(cls._package(extra_tag))
+            for name in cls.EXTRA_TAGS:
+                tags = [cls._package(extra_tag) for extra_tag in child_tags[name]]
                 if tags:
                     extra[name] = tags
 
@@ -461,7 +527,7 @@ class Registration(XMLParser):
         )
 
         children: list["Registration"] = []
-        for child_tag in tag.xpath("additionalEntry"):
+        for child_tag in child_tags["additionalEntry"]:
             for child_registration in cls.from_tag(tag=child_tag, parent=registration):
                 children.append(child_registration)
                 # registration.children.append(child_registration)
@@ -518,124 +584,161 @@ class Registration(XMLParser):
             )
             yield registration
 
-    FOREIGN_PREFIXES = {"AF", "AFO", "AF0"}
-    INTERIM_PREFIXES = {"AI", "AIO", "AI0"}
+    FOREIGN_PREFIXES = ("AF", "AFO", "AF0")
+    INTERIM_PREFIXES = ("AI", "AIO", "AI0")
 
     PREVIOUSLY_PUBLISHED_ABROAD = re.compile(r"[pd]u[bt][.,]? abroad", re.I)
     PREVIOUSLY_PUBLISHED = re.compile(r"[pd]rev[.,]? [pd]u[bt]", re.I)
     PREVIOUSLY_REGISTERED = re.compile(r"[pd]rev[.,]? reg", re.I)
     PREVIOUSLY_SOMETHING = re.compile(r"[pd]rev[.,i]", re.I)
 
-    def _regnum_is_foreign(self, regnum) -> bool:
-        if any(regnum.startswith(x) for x in self.FOREIGN_PREFIXES):
-            self.warnings.append(
-                "Regnum '%s' indicates a foreign registration." % regnum
-            )
-            return True
-        if any(regnum.startswith(x) for x in self.INTERIM_PREFIXES):
-            self.warnings.append(
-                "Regnum '%s' indicates an interim (and foreign) registration." % regnum
+    # The rules below are combined into one regular expression per
+    # field, with one group per rule, most reliable rule first. The
+    # matches can't overlap, so a single finditer() sees every rule
+    # that applies.
+    FOREIGN_TEXT_RULES = re.compile(
+        r"((?i:%s))|(AI[.-])" % PREVIOUSLY_PUBLISHED_ABROAD.pattern
+    )
+    FOREIGN_TEXT_WARNINGS = (
+        "%s %r indicates work was previously published abroad.",
+        "%s '%s' seems to mention an interim registration.",
+    )
+
+    FOREIGN_KEYWORDS = ("abroad", "american ed.", "american edition")
+    FOREIGN_KEYWORD_RULES = re.compile(
+        "|".join("(%s)" % re.escape(x) for x in FOREIGN_KEYWORDS)
+    )
+
+    PREVIOUS_NOTE_RULES = re.compile(
+        "|".join(
+            "(%s)" % x.pattern
+            for x in (
+                PREVIOUSLY_PUBLISHED,
+                PREVIOUSLY_REGISTERED,
+                PREVIOUSLY_SOMETHING,
             )
-            return True
-        return False
+        ),
+        re.I,
+    )
+    PREVIOUS_NOTE_WARNINGS = (
+        "Note (%r) seems to mention a previous publication, which must be checked manually.",
+        "Note (%r) seems to mention a previous registration, which must be checked manually.",
+        "Note (%r) seems to mention... something... happening previously, most likely a publication or registration. This must be checked manually.",
+    )
 
-    @property
-    def previously_published(self) -> bool:
-        """See if it looks like this work was previously published -- in which
-        case we'd need to manually check for earlier registrations
-        which may have been renewed.
+    @staticmethod
+    def _first_rule(rules, text) -> int | None:
+        """Find the most reliable of `rules` that matches `text`.
+
+        :return: The index of the rule, or None if none of them match.
+        """
+        best = None
+        for match in rules.finditer(text):
+            rule = match.lastindex - 1
+            if best is None or rule < best:
+                best = rule
+                if best == 0:
+                    break
+        return best
+
+    def _verdict(self, slot, classify) -> bool:
+        """Classify this registration, unless that's already been done,
+        and add the reason to its warnings the first time.
+        """
+        verdict = getattr(self, slot)
+        if verdict is None:
+            verdict = classify()
+            setattr(self, slot, verdict)
+            if verdict[1]:
+                self.warnings.append(verdict[1])
+        return verdict[0]
+
+    def classify_previously_published(self) -> tuple[bool, str | None]:
+        """See if it looks like this work was previously published.
+
+        :return: A 2-tuple (verdict, reason). The reason is None if
+            there's nothing to warn about.
         """
         if self.previous_publications:
-            return True
+            return True, None
 
         if self.new_matter_claimed:
-            self.warnings.append(
+            return True, (
                 "New matter claimed (%s) implies the existence of a previous publication, which must be checked manually. New matter found in this title may be out of copyright even if the previous publication was renewed."
                 % ", ".join(self.new_matter_claimed)
             )
-            return True
 
         for note in self.notes:
-            if self.PREVIOUSLY_PUBLISHED.search(note):
-                self.warnings.append(
-                    "Note (%r) seems to mention a previous publication, which must be checked manually."
-                    % note
-                )
-                return True
-            if self.PREVIOUSLY_REGISTERED.search(note):
-                self.warnings.append(
-                    "Note (%r) seems to mention a previous registration, which must be checked manually."
-                    % note
-                )
-                return True
-            if self.PREVIOUSLY_SOMETHING.search(note):
-                self.warnings.append(
-                    "Note (%r) seems to mention... something... happening previously, most likely a publication or registration. This must be checked manually."
-                    % note
-                )
-                return True
+            rule = self._first_rule(self.PREVIOUS_NOTE_RULES, note)
+            if rule is not None:
+                return True, self.PREVIOUS_NOTE_WARNINGS[rule] % note
 
-        return False
+        return False, None
 
     @property
-    def is_foreign(self) -> bool:
+    def previously_published(self) -> bool:
+        """See if it looks like this work was previously published -- in which
+        case we'd need to manually check for earlier registrations
+        which may have been renewed.
+        """
+        return self._verdict("_previously_published", self.classify_previously_published)
+
+    def classify_foreign(self) -> tuple[bool, str | None]:
         """See if it's possible to determine that this registration is for a
         foreign work, based solely on the metadata.
-        """
-        # Maybe the registration is a foreign or interim registration.
-        for regnum in self.regnums:
-            if self._regnum_is_foreign(regnum):
-                return True
 
-        # Maybe there's a previous registration number that's
-        # a foreign or interim registration.
-        for prev_regnum in self.previous_regnums:
-            if self._regnum_is_foreign(prev_regnum):
-                return True
+        :return: A 2-tuple (verdict, reason).
+        """
+        # Maybe the registration is a foreign or interim registration,
+        # or there's a previous registration number that's a foreign
+        # or interim registration.
+        for regnums in (self.regnums, self.previous_regnums):
+            for regnum in regnums:
+                if regnum.startswith(self.FOREIGN_PREFIXES):
+                    return True, (
+                        "Regnum '%s' indicates a foreign registration." % regnum
+                    )
+                if regnum.startswith(self.INTERIM_PREFIXES):
+                    return True, (
+                        "Regnum '%s' indicates an interim (and foreign) registration."
+                        % regnum
+                    )
 
         # Maybe the 'previous publication' information or the notes
         # says that the work was previously published abroad, without
-        # giving a specific registration number.
+        # giving a specific registration number. While we're looking,
+        # note the first one that mentions one of the keywords.
+        keyword = None
         for field, values in (
             ("Previous publication", self.previous_publications),
             ("Note", self.notes),
         ):
             for value in values:
-                if self.PREVIOUSLY_PUBLISHED_ABROAD.search(value):
-                    self.warnings.append(
-                        "%s %r indicates work was previously published abroad."
-                        % (field, value)
-                    )
-                    return True
-                if "AI." in value or "AI-" in value:
-                    self.warnings.append(
-                        "%s '%s' seems to mention an interim registration."
-                        % (field, value)
-                    )
-                    return True
+                rule = self._first_rule(self.FOREIGN_TEXT_RULES, value)
+                if rule is not None:
+                    return True, self.FOREIGN_TEXT_WARNINGS[rule] % (field, value)
+                if keyword is None:
+                    rule = self._first_rule(self.FOREIGN_KEYWORD_RULES, value.lower())
+                    if rule is not None:
+                        keyword = (field, value, self.FOREIGN_KEYWORDS[rule])
 
         # Maybe the book was published in a foreign place.
         for place in self.places:
             if self.PLACES.is_foreign(place):
-                self.warnings.append("Publication place '%s' looks foreign." % place)
-                return True
+                return True, "Publication place '%s' looks foreign." % place
 
         # Maybe a previous publication mentions certain keywords. These
-        # are not terribly reliable, so we run this test last.
-        for field, values in (
-            ("Previous publication", self.previous_publications),
-            ("Note", self.notes),
-        ):
-            for value in values:
-                p = value.lower()
-                for keyword in ["abroad", "american ed.", "american edition"]:
-                    if keyword in p:
-                        self.warnings.append(
-                            "%s %r mentions the keyword '%s', which indicates this _may_ have originally been a foreign publication."
-                            % (field, value, keyword)
-                        )
-                        return True
-        return False
+        # are not terribly reliable, so this test comes last.
+        if keyword:
+            return True, (
+                "%s %r mentions the keyword '%s', which indicates this _may_ have originally been a foreign publication."
+                % keyword
+            )
+        return False, None
+
+    @property
+    def is_foreign(self) -> bool:
+        return self._verdict("_foreign", self.classify_foreign)
 
     DATE_AND_NUMBER_XREF = re.compile(
         r"([0-9]{,2}[A-Z][a-z]{2}[0-9]{2})[;,] ?(A[A-Z]?[0-9-]+)"
@@ -741,6 +844,13 @@ class Registration(XMLParser):
     def _normalize_date(self, date):
         if not date:
             return None
+        normalized = date.get("_normalized")
+        if normalized:
+            # Already parsed by an earlier stage.
+            return datetime.datetime.fromisoformat(normalized)
+        if date.get("_error"):
+            self.warnings.append("Could not parse date %s" % date["_text"])
+            return None
         parsed = self._parse_date(date["_text"], self.warnings)
         if parsed:
             date["_normalized"] = parsed.isoformat()[:10]
@@ -857,14 +967,72 @@ class Registration(XMLParser):
 class Renewal(object):
     csv_row_labels = "renewal_id renewal_date renewal_registration registration_date renewal_title renewal_author".split()
 
-    def __init__(self, **data):
-        self.data = data
+    # Stage 2 keeps every Renewal in memory at once.
+    __slots__ = (
+        "uuid",
+        "regnum",
+        "reg_date",
+        "reg_years",
+        "renewal_id",
+        "renewal_date",
+        "author",
+        "title",
+        "new_matter",
+        "see_also_renewal",
+        "see_also_registration",
+        "full_text",
+        "claimants",
+        "notes",
+    )
+
+    def __init__(
+        self,
+        uuid: str | None = None,
+        regnum: list | None = None,
+        reg_date: list | None = None,
+        reg_years: list | None = None,
+        renewal_id: str | None = None,
+        renewal_date: str | None = None,
+        author: str | None = None,
+        title: str | None = None,
+        new_matter: str | None = None,
+        see_also_renewal: list | None = None,
+        see_also_registration: list | None = None,
+        full_text: str | None = None,
+        claimants: str | list | None = None,
+        notes: str | None = None,
+    ):
+        self.uuid = uuid
+        self.regnum = regnum
+        self.reg_date = reg_date
+        self.reg_years = reg_years
+        self.renewal_id = renewal_id
+        self.renewal_date = renewal_date
+        self.author = author
+        self.title = title
+        self.new_matter = new_matter
+        self.see_also_renewal = see_also_renewal
+        self.see_also_registration = see_also_registration
+        self.full_text = full_text
+        self.claimants = claimants
+        self.notes = notes
+
+    @classmethod
+    def from_json(cls, data) -> "Renewal":
+        return cls(**data)
+
+    @classmethod
+    def load(cls, path) -> Iterable["Renewal"]:
+        """Load Renewals from a file written by one of the stages."""
+        for data in codec.read(path):
+            yield cls.from_json(data)
 
     def jsonable(self):
         return {
             'uuid': self.uuid,
             'regnum': self.regnum,
             'reg_date': self.reg_date,
+            'reg_years': self.registration_years,
             'renewal_id': self.renewal_id,
             'renewal_date': self.renewal_date,
             'author': self.author,
@@ -878,25 +1046,40 @@ class Renewal(object):
         }
 
 
+    @classmethod
+    def parse_years(cls, reg_date) -> list[int | None]:
+        """Find the year of each registration date, or None if it
+        can't be parsed.
+        """
+        return dates.years(reg_date)
+
+    @property
+    def registration_years(self) -> list[int | None]:
+        """The year of each date in reg_date.
+
+        Stage 1 stores these, so they only need to be worked out here
+        for renewals loaded from an older file.
+        """
+        if self.reg_years is None:
+            self.reg_years = self.parse_years(self.reg_date)
+        return self.reg_years
+
     @property
     def renewal_key(self):
         def to_set(x):
             return Registration(Registration._normalize_text(x).split())
 
-        return to_set(self.data["title"]), to_set(self.data["author"])
-
-    def __getattr__(self, k):
-        return self.data[k]
+        return to_set(self.title), to_set(self.author)
 
     @property
     def csv_row(self):
         return [
-            self.data.get("renewal_id"),
-            self.data.get("renewal_date"),
+            self.renewal_id,
+            self.renewal_date,
             self.regnum,
-            self.data.get("reg_date"),
-            self.data.get("title"),
-            self.data.get("author"),
+            self.reg_date,
+            self.title,
+            self.author,
         ]
 
     REG_NUMBER = re.compile(r"[A-QS-Z][\w-]*?\d{3,}-?\w*\d+")
@@ -1083,6 +1266,7 @@ class Renewal(object):
             uuid=uuid,
             regnum=regnum,
             reg_date=reg_date,
+            reg_years=cls.parse_years(reg_date),
             renewal_id=renewal_id,
             renewal_date=renewal_date,
             author=author,
@@ -0,0 +1,39 @@
+import pytest
+
+from model import Places
+
+
+@pytest.fixture(scope="module")
+def places():
+    return Places()
+
+
+@pytest.mark.parametrize(
+    "place, foreign",
+    [
+        # A place that ends with a period is never foreign; see
+        # Places.is_foreign.
+        ("London, Eng.", False),
+        ("Paris.", False),
+        ("Paris", True),
+        # Any mention of a big foreign city after a comma counts.
+        ("London, New York", True),
+        ("Toronto, Canada", True),
+        # Georgia is taken to be the state.
+        ("Tbilisi, Georgia", False),
+        ("Boston", False),
+    ],
+)
+def test_is_foreign(places, place, foreign):
+    assert places.is_foreign(place) is foreign
+
+
+def test_foreign_places(places, monkeypatch):
+    column = ["Paris", "Boston", "London, Eng.", "Paris", "Toronto, Canada", "Boston"]
+    checked = []
+    is_foreign = places.is_foreign
+    monkeypatch.setattr(
+        places, "is_foreign", lambda x: checked.append(x) or is_foreign(x)
+    )
+    assert places.foreign_places(column) == [True, False, False, True, True, False]
+    assert sorted(checked) == sorted(set(column))
@@ -0,0 +1,412 @@
+# Run the numbered scripts in order, redoing only the work whose inputs
+# have changed since the last run.
+#
+# The content hash of every input and output is recorded in
+# output/manifest.json. Stages 0 and 1 are split into one shard per
+# input file (registration volume or renewal TSV), so after a
+# submodule update only the volumes that actually changed get
+# reparsed. The later stages need to see everything at once, so they
+# run as a whole -- but only if one of their inputs changed.
+import argparse
+import functools
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from multiprocessing import Pool
+
+import codec
+import dates
+import metrics
+
+MANIFEST = "output/manifest.json"
+SHARDS = "output/shards"
+
+# Code that every stage depends on. If it changes, everything is
+# out of date.
+SHARED_CODE = ["model.py", "codec.py", "dates.py"]
+
+
+def settings() -> dict:
+    """The environment settings that change the bytes a stage writes.
+
+    The file format and JSON library aren't files, so they go in the
+    key of every stage alongside the input hashes.
+    """
+    return dict(format=codec.FORMAT, json=codec.JSON_BACKEND)
+
+
+class Manifest:
+    """Content hashes of the files involved in each stage, as of the
+    last time the stage ran.
+    """
+
+    def __init__(self, path=MANIFEST):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+        # Hashes of individual files, along with the size and
+        # modification time at which they were calculated, so we
+        # don't need to rehash big files that haven't been touched.
+        self.files = data.get("files", {})
+        self.stages = data.get("stages", {})
+
+    def hash(self, path) -> str | None:
+        """Find the SHA-256 hash of a file, or None if it doesn't exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        known = self.files.get(path)
+        if (
+            known
+            and known["size"] == stat.st_size
+            and known["mtime"] == stat.st_mtime_ns
+        ):
+            return known["sha256"]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        self.files[path] = dict(
+            size=stat.st_size, mtime=stat.st_mtime_ns, sha256=digest.hexdigest()
+        )
+        return digest.hexdigest()
+
+    def hashes(self, paths) -> dict[str, str | None]:
+        return {path: self.hash(path) for path in paths}
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run can't
+        # leave a truncated manifest behind.
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(files=self.files, stages=self.stages), f, indent=1)
+        os.replace(tmp, self.path)
+
+
+class Stage:
+    """A numbered script that turns a fixed set of input files into a
+    fixed set of output files.
+    """
+
+    def __init__(self, script, inputs, outputs, code=(), parallel=False):
+        """Constructor.
+
+        :param parallel: Whether the script takes a --workers option.
+        """
+        self.script = script
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = [script] + list(code) + SHARED_CODE
+        self.parallel = parallel
+
+    @property
+    def name(self):
+        return self.script[: -len(".py")]
+
+    def run(self, manifest, force=False, workers=1, profile=None) -> bool:
+        """Run this stage if it's out of date.
+
+        :param profile: How to profile the stage, as with CCE_PROFILE.
+        :return: True if the stage was run, False if it was skipped.
+        """
+        inputs = manifest.hashes(self.inputs + self.code)
+        record = manifest.stages.get(self.name)
+        if (
+            not force
+            and record
+            and record["inputs"] == inputs
+            and record.get("settings") == settings()
+            and manifest.hashes(self.outputs) == record["outputs"]
+        ):
+            print("%s: up to date" % self.name)
+            return False
+        print("%s: running" % self.name)
+        self.build(workers, profile)
+        manifest.stages[self.name] = dict(
+            inputs=inputs, settings=settings(), outputs=manifest.hashes(self.outputs)
+        )
+        manifest.save()
+        return True
+
+    def build(self, workers, profile=None):
+        command = [sys.executable, self.script]
+        if self.parallel and workers > 1:
+            command += ["--workers", str(workers)]
+        env = None
+        if profile:
+            env = dict(os.environ, CCE_PROFILE=profile)
+        subprocess.run(command, check=True, env=env)
+
+
+class ShardedStage(Stage):
+    """A stage that processes each of its input files independently.
+
+    Each input file becomes a shard with its own output files under
+    output/shards/. The stage's real outputs are the concatenation of
+    the shards, in the same order the script itself would process the
+    input files.
+    """
+
+    def __init__(self, script, shard_inputs, process, outputs, inputs=(), code=()):
+        """Constructor.
+
+        :param shard_inputs: A function that returns the list of input
+            files, one per shard.
+        :param process: The name of a function in `script` that
+            processes one input file and returns the records for each
+            output file, in the same order as `outputs`.
+        :param inputs: Files that every shard depends on.
+        """
+        super().__init__(script, inputs, outputs, code)
+        self.shard_inputs = shard_inputs
+        self.process = process
+
+    def module(self):
+        return importlib.import_module(self.name)
+
+    def shard_outputs(self, path) -> list[str]:
+        base = os.path.join(SHARDS, self.name, os.path.relpath(path))
+        return [codec.path("%s.%d" % (base, i)) for i in range(len(self.outputs))]
+
+    def run(self, manifest, force=False, workers=1, profile=None) -> bool:
+        common = manifest.hashes(self.inputs + self.code)
+        record = manifest.stages.get(self.name, {})
+        old_shards = record.get("shards", {})
+
+        paths = list(self.shard_inputs())
+        shards = {}
+        todo = []
+        for path in paths:
+            key = dict(input=manifest.hash(path), common=common, settings=settings())
+            old = old_shards.get(path)
+            if (
+                not force
+                and old
+                and old["key"] == key
+                and manifest.hashes(self.shard_outputs(path)) == old["outputs"]
+            ):
+                shards[path] = old
+            else:
+                shards[path] = dict(key=key)
+                todo.append(path)
+
+        for path in set(old_shards) - set(paths):
+            # This input file is gone; so is its shard.
+            for shard_output in self.shard_outputs(path):
+                if os.path.exists(shard_output):
+                    os.remove(shard_output)
+
+        if (
+            not todo
+            and set(old_shards) == set(paths)
+            and manifest.hashes(self.outputs) == record.get("outputs")
+        ):
+            print("%s: up to date" % self.name)
+            return False
+
+        print("%s: %d of %d shards out of date" % (self.name, len(todo), len(paths)))
+        # The script doesn't run on its own, so the stage's report
+        # comes from here.
+        run = metrics.Metrics(stage=self.name, profile=profile)
+        serialize = run.phase("serialize")
+        process = getattr(self.module(), self.process)
+        if workers > 1 and len(todo) > 1:
+            pool = Pool(workers)
+            results = pool.imap(functools.partial(process_shard, process, profile), todo)
+        else:
+            pool = None
+            run.caches["dates"] = dates.stats
+            results = ((process(path), None) for path in todo)
+        # The date stats from each worker add up as it goes; keep the
+        # latest.
+        worker_dates = {}
+        # Parsing includes encoding, which happens in `process`.
+        for i, (path, (result, worker)) in enumerate(
+            zip(todo, run.timed("parse", results))
+        ):
+            if worker:
+                pid, stats = worker
+                run.add(stats)
+                worker_dates[pid] = stats["dates"]
+            if len(self.outputs) == 1:
+                result = (result,)
+            shard_outputs = self.shard_outputs(path)
+            with serialize:
+                os.makedirs(os.path.dirname(shard_outputs[0]), exist_ok=True)
+                for shard_output, records in zip(shard_outputs, result):
+                    with open(shard_output, "wb") as out:
+                        out.writelines(records)
+            run.count(sum(len(records) for records in result))
+            shards[path]["outputs"] = manifest.hashes(shard_outputs)
+            if i % 100 == 99:
+                # Save progress now and then, so an interrupted run
+                # doesn't have to start over.
+                self._record(manifest, shards, None)
+        if pool:
+            pool.close()
+            pool.join()
+            run.caches["dates"] = dates.combine(worker_dates.values())
+
+        # Put the shards back together.
+        with run.phase("assemble"):
+            for i, output in enumerate(self.outputs):
+                with open(output, "wb") as out:
+                    for path in paths:
+                        with open(self.shard_outputs(path)[i], "rb") as shard:
+                            shutil.copyfileobj(shard, out)
+        run.finish()
+        self._record(manifest, shards, manifest.hashes(self.outputs))
+        return True
+
+    def _record(self, manifest, shards, outputs):
+        manifest.stages[self.name] = dict(
+            shards={k: v for k, v in shards.items() if "outputs" in v},
+            outputs=outputs,
+        )
+        manifest.save()
+
+
+def process_shard(process, profile, path):
+    """Process one shard in a worker process, measuring the work.
+
+    :return: A 2-tuple (what process(path) returned, (process ID,
+        stats)), where the stats are measure()'s, along with this
+        worker's date stats so far.
+    """
+    result, stats = metrics.measure(process, path, profile=profile)
+    stats["dates"] = dates.stats()
+    return result, (os.getpid(), stats)
+
+
+def registration_volumes():
+    return importlib.import_module("0-parse-registrations").Parser().volumes(
+        "registrations/xml"
+    )
+
+
+def renewal_files():
+    return importlib.import_module("1-parse-renewals").Parser.renewal_files(
+        "renewals/data"
+    )
+
+
+FINAL = [
+    "foreign",
+    "previously-published",
+    "too-late",
+    "too-early",
+    "renewed",
+    "probably-renewed",
+    "possibly-renewed",
+    "not-renewed",
+    "not-books-proper",
+    "error",
+    "probably-not-renewed",
+]
+FILTERED = [
+    "in-range",
+    "foreign",
+    "previously-published",
+    "too-late",
+    "too-early",
+    "not-books-proper",
+    "error",
+]
+
+STAGES = [
+    ShardedStage(
+        "0-parse-registrations.py",
+        registration_volumes,
+        "parse_volume",
+        outputs=[
+            codec.path("output/0-parsed-registrations"),
+            codec.path("output/0-parsed-registrations-crossRef"),
+        ],
+    ),
+    ShardedStage(
+        "1-parse-renewals.py",
+        renewal_files,
+        "parse_renewal_file",
+        outputs=[codec.path("output/1-parsed-renewals")],
+        inputs=["llm/renewals-from-lm.ndjson"],
+    ),
+    Stage(
+        "2-match-renewals.py",
+        inputs=[
+            codec.path("output/0-parsed-registrations"),
+            codec.path("output/0-parsed-registrations-crossRef"),
+            codec.path("output/1-parsed-renewals"),
+        ],
+        outputs=[
+            codec.path("output/2-registrations-with-renewals"),
+            codec.path("output/2-cross-references-in-foreign-registrations"),
+            codec.path("output/2-renewals-with-registrations"),
+            codec.path("output/2-renewals-with-no-registrations"),
+        ],
+        code=["compare.py", "renewal_index.py"],
+        parallel=True,
+    ),
+    Stage(
+        "3-filter.py",
+        inputs=[
+            codec.path("output/2-registrations-with-renewals"),
+            codec.path("output/2-cross-references-in-foreign-registrations"),
+        ],
+        outputs=[codec.path("output/3-registrations-%s" % x) for x in FILTERED]
+        + [codec.path("output/3-potentially-foreign-registrations")],
+    ),
+    Stage(
+        "4-sort-it-out.py",
+        inputs=[codec.path("output/3-registrations-%s" % x) for x in FILTERED],
+        outputs=[codec.path("output/FINAL-%s" % x) for x in FINAL],
+    ),
+    Stage(
+        "5-make-tsv.py",
+        inputs=[codec.path("output/FINAL-%s" % x) for x in FINAL],
+        outputs=[
+            "output/FINAL-%s.tsv" % x
+            for x in ["renewed", "not-renewed", "foreign", "previously-published"]
+        ],
+    ),
+]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to parse shards and match renewals with.",
+    )
+    arg_parser.add_argument(
+        "--force", action="store_true", help="Rerun every stage from scratch."
+    )
+    arg_parser.add_argument(
+        "--profile",
+        choices=metrics.PROFILERS,
+        default=metrics.PROFILE,
+        help="Profile every stage, as if CCE_PROFILE were set.",
+    )
+    args = arg_parser.parse_args()
+
+    os.makedirs("output", exist_ok=True)
+    # Each stage writes its own report, and is profiled if asked;
+    # this one shows how long each stage took, including the ones that
+    # were up to date. It isn't profiled itself, since the sharded
+    # stages are profiled in this process.
+    run = metrics.Metrics(profile=None)
+    manifest = Manifest()
+    for stage in STAGES:
+        with run.phase(stage.name):
+            stage.run(
+                manifest, force=args.force, workers=args.workers, profile=args.profile
+            )
+    run.finish()
@@ -0,0 +1,254 @@
+# An on-disk index of the parsed renewals, so Comparator doesn't have
+# to load every renewal into memory before it can start matching.
+#
+# The index is a SQLite database built from 1-parsed-renewals and
+# 0-parsed-registrations-crossRef. It remembers the size and
+# modification time of the files it was built from and gets rebuilt
+# automatically when they change. Opening an existing index takes
+# milliseconds; renewals are only decoded when they're looked up.
+#
+# You can also use it to look up renewals by hand:
+#
+#  python renewal_index.py A123456 A654321
+import os
+import sqlite3
+import sys
+
+import codec
+from model import Registration, Renewal
+
+INDEX = "output/renewal-index.sqlite"
+
+# Change this when the layout of the database changes, so old indexes
+# get rebuilt.
+VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE renewals (id INTEGER PRIMARY KEY, data BLOB);
+CREATE TABLE regnums (id INTEGER PRIMARY KEY, regnum TEXT UNIQUE);
+CREATE TABLE by_regnum (regnum INTEGER, renewal INTEGER);
+CREATE TABLE by_title (title TEXT, renewal INTEGER);
+CREATE TABLE crossrefs (uuid TEXT, data BLOB);
+"""
+
+INDEXES = """
+CREATE INDEX by_regnum_regnum ON by_regnum (regnum);
+CREATE INDEX by_title_title ON by_title (title);
+CREATE INDEX crossrefs_uuid ON crossrefs (uuid);
+"""
+
+
+def regnum_keys(renewal) -> list[str]:
+    """The keys a renewal is filed under in RenewalIndex.renewals."""
+    regnum = renewal.regnum
+    if not regnum:
+        regnum = []
+    if not isinstance(regnum, list):
+        regnum = [regnum]
+    return [(r or "").replace("-", "") for r in regnum]
+
+
+def title_key(renewal) -> str | None:
+    """The key a renewal is filed under in RenewalIndex.renewals_by_title."""
+    return Registration._normalize_text(renewal.title) or renewal.title
+
+
+class Lookup:
+    """One of the tables in a RenewalIndex, looked at like the
+    defaultdict(list) it replaces: a missing key gives an empty list.
+    """
+
+    def __init__(self, index, query):
+        self.index = index
+        self.query = query
+
+    def __getitem__(self, key) -> list:
+        return self.index._fetch(self.query, key)
+
+    def __contains__(self, key) -> bool:
+        return bool(self[key])
+
+
+class RenewalIndex:
+    def __init__(self, path=INDEX):
+        """Open an index that has already been built."""
+        self.path = path
+        self.db = sqlite3.connect(
+            "file:%s?mode=ro" % path, uri=True, check_same_thread=False
+        )
+        # Let SQLite read the database through the page cache instead
+        # of copying it into its own buffers.
+        self.db.execute("PRAGMA mmap_size=%d" % (1024 ** 3))
+        self.decode = codec.decoder("ndjson")
+
+        # The same renewal always comes back as the same object, so
+        # callers can keep track of renewals in sets.
+        self._renewals = {}
+        self._ids = {}
+
+        self.renewals = Lookup(
+            self,
+            "SELECT b.renewal, r.data FROM by_regnum b"
+            " JOIN regnums g ON g.id = b.regnum"
+            " JOIN renewals r ON r.id = b.renewal"
+            " WHERE g.regnum = ? ORDER BY b.rowid",
+        )
+        self.renewals_by_title = Lookup(
+            self,
+            "SELECT b.renewal, r.data FROM by_title b"
+            " JOIN renewals r ON r.id = b.renewal"
+            " WHERE b.title = ? ORDER BY b.rowid",
+        )
+
+    @classmethod
+    def open(cls, renewals_path, crossrefs_path, path=INDEX) -> "RenewalIndex":
+        """Open the index, building it first if it's missing or was
+        built from different files.
+        """
+        if cls.sources(renewals_path, crossrefs_path) != cls.built_from(path):
+            cls.build(renewals_path, crossrefs_path, path)
+        return cls(path)
+
+    @classmethod
+    def sources(cls, renewals_path, crossrefs_path) -> str:
+        """Describe the input files, so we can tell if they've changed."""
+        description = [VERSION]
+        for source in renewals_path, crossrefs_path:
+            stat = os.stat(source)
+            description.append([source, stat.st_size, stat.st_mtime_ns])
+        return codec.encoder("ndjson")(description).decode("utf8").strip()
+
+    @classmethod
+    def built_from(cls, path) -> str | None:
+        if not os.path.exists(path):
+            return None
+        try:
+            db = sqlite3.connect("file:%s?mode=ro" % path, uri=True)
+            try:
+                row = db.execute(
+                    "SELECT value FROM meta WHERE key = 'sources'"
+                ).fetchone()
+            finally:
+                db.close()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    @classmethod
+    def build(cls, renewals_path, crossrefs_path, path=INDEX):
+        """Build the index from scratch."""
+        # Build into a temporary file, so an interrupted build doesn't
+        # leave a half-finished index behind.
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        db = sqlite3.connect(tmp)
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.executescript(SCHEMA)
+        encode = codec.encoder("ndjson")
+
+        regnum_ids = {}
+        by_regnum = []
+        by_title = []
+        renewals = []
+        for renewal_id, renewal in enumerate(Renewal.load(renewals_path), 1):
+            renewals.append((renewal_id, encode(renewal.jsonable())))
+            for regnum in regnum_keys(renewal):
+                if regnum not in regnum_ids:
+                    regnum_ids[regnum] = len(regnum_ids) + 1
+                by_regnum.append((regnum_ids[regnum], renewal_id))
+            by_title.append((title_key(renewal), renewal_id))
+        db.executemany("INSERT INTO renewals VALUES (?, ?)", renewals)
+        db.executemany(
+            "INSERT INTO regnums VALUES (?, ?)",
+            ((i, regnum) for regnum, i in regnum_ids.items()),
+        )
+        db.executemany("INSERT INTO by_regnum VALUES (?, ?)", by_regnum)
+        db.executemany("INSERT INTO by_title VALUES (?, ?)", by_title)
+
+        crossrefs = []
+        for cross in codec.read(crossrefs_path):
+            cross_uuid = cross.get("uuid")
+            if cross_uuid:
+                res = dict(authors=cross.get("authors"), title=cross.get("title"))
+                crossrefs.append((cross_uuid, encode(res)))
+        db.executemany("INSERT INTO crossrefs VALUES (?, ?)", crossrefs)
+
+        db.executescript(INDEXES)
+        db.execute(
+            "INSERT INTO meta VALUES ('sources', ?)",
+            (cls.sources(renewals_path, crossrefs_path),),
+        )
+        db.commit()
+        db.close()
+        os.replace(tmp, path)
+
+    def renewal(self, renewal_id, data=None) -> Renewal:
+        """Find a renewal by its row in the index."""
+        renewal = self._renewals.get(renewal_id)
+        if renewal is None:
+            if data is None:
+                (data,) = self.db.execute(
+                    "SELECT data FROM renewals WHERE id = ?", (renewal_id,)
+                ).fetchone()
+            renewal = Renewal.from_json(self.decode(data))
+            self._renewals[renewal_id] = renewal
+            self._ids[renewal] = renewal_id
+        return renewal
+
+    def renewal_id(self, renewal) -> int:
+        """Find the row of a renewal that came from this index.
+
+        Unlike the Renewal object itself, this is the same in every
+        process that opens the index.
+        """
+        return self._ids[renewal]
+
+    def _fetch(self, query, key) -> list[Renewal]:
+        return [
+            self.renewal(renewal_id, data)
+            for renewal_id, data in self.db.execute(query, (key,))
+        ]
+
+    def crossrefs(self, uuid) -> list[dict]:
+        """Find the title and authors of every crossRef with this UUID."""
+        return [
+            self.decode(data)
+            for (data,) in self.db.execute(
+                "SELECT data FROM crossrefs WHERE uuid = ? ORDER BY rowid", (uuid,)
+            )
+        ]
+
+    def items(self):
+        """Yield (regnum, renewals) for every regnum, in the order the
+        regnums first show up in the renewals file.
+        """
+        regnum = renewals = None
+        for key, renewal_id, data in self.db.execute(
+            "SELECT g.regnum, b.renewal, r.data FROM by_regnum b"
+            " JOIN regnums g ON g.id = b.regnum"
+            " JOIN renewals r ON r.id = b.renewal"
+            " ORDER BY b.regnum, b.rowid"
+        ):
+            if key != regnum:
+                if renewals:
+                    yield regnum, renewals
+                regnum, renewals = key, []
+            renewals.append(self.renewal(renewal_id, data))
+        if renewals:
+            yield regnum, renewals
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    index = RenewalIndex.open(
+        codec.path("output/1-parsed-renewals"),
+        codec.path("output/0-parsed-registrations-crossRef"),
+    )
+    for regnum in sys.argv[1:]:
+        for renewal in index.renewals[regnum.replace("-", "")]:
+            print(regnum, renewal.jsonable())